@@ -0,0 +1,207 @@
+import argparse
+import copy
+import json
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from cell_automaton import CellAutomaton
+from config import Config
+from polygon import Polygon
+
+PHASES = ("move", "spread", "update", "statistics", "draw")
+CASE_KEYS = ("engine", "polygon", "cell_count", "infection_radius", "workers")
+
+
+def _time(function, repeats, reset=None):
+    samples = []
+    for _ in range(repeats):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def benchmark_case(engine, polygon, cell_count, infection_radius, infected_count, repeats, seed, draw=True,
+                   workers=None):
+    polygon_points, scale = Polygon.create_preset(polygon)
+    config = Config(polygon_points=polygon_points, cell_count=cell_count, infected_count=min(infected_count, cell_count),
+                    latent_prob=0.25, infection_radius=infection_radius, engine=engine, seed=seed,
+                    parallel_workers=workers)
+
+    start = time.perf_counter()
+    automaton = CellAutomaton(config)
+    seeding = time.perf_counter() - start
+
+    # Fast-forward to the contagious part of the curve so the spread phase does real work
+    automaton.current_day = int(config.contagiousness[0])
+    if automaton.population is not None:
+        automaton.population.current_day = automaton.current_day
+    for cell in automaton.cells:
+        cell.current_day = automaton.current_day
+
+    reset = _state_restorer(automaton)
+    phases = {
+        "move": automaton._move_cells,
+        "spread": automaton._spread_infections,
+        "update": automaton._update_cells,
+        "statistics": automaton.get_statistics,
+    }
+    if draw:
+        try:
+            import pygame
+        except ImportError:
+            draw = False
+        else:
+            screen = pygame.Surface((600, 400))
+            automaton.scale = scale
+            automaton.show_radius = True
+            phases["draw"] = lambda: automaton.draw(screen)
+
+    result = {"engine": engine, "polygon": polygon, "cell_count": cell_count, "infection_radius": infection_radius,
+              "workers": getattr(automaton.population, "workers", None), "seeding": seeding}
+    for phase, function in phases.items():
+        # Spread and update change states; restoring them keeps every repeat measuring the same epidemic snapshot
+        phase_reset = reset if phase in ("spread", "update") else None
+        samples = _time(function, repeats + 1, phase_reset)[1:]
+        result[phase] = statistics.median(samples)
+        result[f"{phase}_min"] = min(samples)
+    result["step"] = result["move"] + result["spread"] / config.infection_checks_per_iter
+    automaton.close()
+    return result
+
+
+def _state_restorer(automaton):
+    # Everything spread and update change: states, clocks, radius alphas and the population's event calendars
+    state_counts = dict(automaton.state_counts)
+    if automaton.population is not None:
+        population = automaton.population
+        arrays = {name: getattr(population, name).copy()
+                  for name in ("state", "infection_start_day", "activation_day", "infection_alpha")}
+        calendars = copy.deepcopy((population._recoveries, population._activations, population._pending_latent,
+                                   population._latent_probability))
+
+        def restore():
+            for name, values in arrays.items():
+                getattr(population, name)[:] = values
+            population.reindex()
+            (population._recoveries, population._activations, population._pending_latent,
+             population._latent_probability) = copy.deepcopy(calendars)
+            automaton.state_counts = dict(state_counts)
+    else:
+        saved = [(cell._state, cell._infection_start_day, cell._infection_alpha) for cell in automaton.cells]
+
+        def restore():
+            for cell, (state, start_day, alpha) in zip(automaton.cells, saved):
+                cell._state, cell._infection_start_day, cell._infection_alpha = state, start_day, alpha
+            automaton.state_counts = dict(state_counts)
+    return restore
+
+
+def run_benchmarks(engines, polygons, cell_counts, radii, infected_count=100, repeats=5, seed=0, draw=True,
+                   report=None, parallel_workers=(None,)):
+    results = []
+    for engine in engines:
+        # Only the parallel engine has workers to scale; None uses every core
+        for workers in parallel_workers if engine == "parallel" else (None,):
+            for polygon in polygons:
+                for cell_count in cell_counts:
+                    for infection_radius in radii:
+                        result = benchmark_case(engine, polygon, cell_count, infection_radius, infected_count,
+                                                repeats, seed, draw, workers)
+                        results.append(result)
+                        if report:
+                            report(result)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeats": repeats,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold):
+    # A phase regresses when its median is more than threshold (relative) slower than the baseline's
+    # Files from before worker counts were recorded have no "workers" key, which matches None
+    baseline_cases = {tuple(case.get(key) for key in CASE_KEYS): case for case in baseline["results"]}
+    regressions = []
+    for case in results["results"]:
+        reference = baseline_cases.get(tuple(case.get(key) for key in CASE_KEYS))
+        if reference is None:
+            continue
+        for phase in ("seeding", "step", *PHASES):
+            if phase not in case or phase not in reference or reference[phase] <= 0:
+                continue
+            ratio = case[phase] / reference[phase]
+            if ratio > 1 + threshold:
+                regressions.append({**{key: case.get(key) for key in CASE_KEYS}, "phase": phase,
+                                    "baseline": reference[phase], "current": case[phase], "ratio": ratio})
+    return regressions
+
+
+def _integers(text):
+    return [int(value) for value in text.split(",")]
+
+
+def _floats(text):
+    return [float(value) for value in text.split(",")]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time CellAutomaton phases across population sizes and polygons.")
+    parser.add_argument("--engines", default="population", help="comma-separated engines")
+    parser.add_argument("--polygons", default=",".join(Polygon.PRESETS), help="comma-separated polygon presets")
+    parser.add_argument("--cell-counts", type=_integers, default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--radii", type=_floats, default=[5.0, 10.0])
+    parser.add_argument("--parallel-workers", type=_integers, default=[None],
+                        help="comma-separated worker counts to time the parallel engine with (default: all cores)")
+    parser.add_argument("--infected-count", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-draw", action="store_true", help="skip the pygame draw phase")
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored results file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown before flagging")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    def report(result):
+        phases = " ".join(f"{phase}={result[phase] * 1000:.2f}ms" for phase in PHASES if phase in result)
+        workers = f" workers={result['workers']}" if result["workers"] else ""
+        print(f"{result['engine']}{workers} {result['polygon']} n={result['cell_count']} "
+              f"r={result['infection_radius']}: seeding={result['seeding'] * 1000:.1f}ms {phases}", file=sys.stderr)
+
+    results = run_benchmarks(args.engines.split(","), args.polygons.split(","), args.cell_counts, args.radii,
+                             args.infected_count, args.repeats, args.seed, not args.no_draw, report,
+                             args.parallel_workers)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['engine']} {regression['polygon']} n={regression['cell_count']} "
+                  f"r={regression['infection_radius']} {regression['phase']}: "
+                  f"{regression['baseline'] * 1000:.2f}ms -> {regression['current'] * 1000:.2f}ms "
+                  f"({regression['ratio']:.2f}x)", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Headless entry points must never load these
+GUI_MODULES = ("pygame", "PyQt5", "matplotlib")
+
+# name -> (code run in a fresh interpreter, whether GUI modules are allowed)
+TARGETS = {
+    "config": ("import config", False),
+    "cell_automaton": ("import cell_automaton", False),
+    "simulate": ("import simulate", False),
+    "ensemble": ("import ensemble", False),
+    "checkpoint": ("import checkpoint", False),
+    # What an ensemble or batch worker pays before its first step
+    "headless_first_step": (
+        "from cell_automaton import CellAutomaton\n"
+        "from config import Config\n"
+        "CellAutomaton(Config(seed=0)).update(1, 0)",
+        False,
+    ),
+    "main_window": ("import main_window", True),
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+exec(compile({code!r}, "<target>", "exec"))
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": len(sys.modules),
+                   "gui": sorted({{name.split(".")[0] for name in sys.modules}} & set({gui!r}))}}))
+"""
+
+
+def measure(code, repeats):
+    # A fresh interpreter per sample, so nothing is already imported; the OS file cache stays warm
+    environment = dict(os.environ, QT_QPA_PLATFORM="offscreen", SDL_VIDEODRIVER="dummy",
+                       PYGAME_HIDE_SUPPORT_PROMPT="1")
+    samples = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", PROBE.format(code=code, gui=GUI_MODULES)], check=True,
+                                capture_output=True, text=True, env=environment,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(sample["seconds"] for sample in samples),
+        "modules": samples[-1]["modules"],
+        "gui_modules": samples[-1]["gui"],
+    }
+
+
+def run_benchmarks(targets, repeats=5, report=None):
+    results = []
+    for name in targets:
+        code, gui_allowed = TARGETS[name]
+        result = {"target": name, "gui_allowed": gui_allowed, **measure(code, repeats)}
+        results.append(result)
+        if report:
+            report(result)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+def problems(results, baseline=None, threshold=0.2):
+    found = []
+    for result in results["results"]:
+        if result["gui_modules"] and not result["gui_allowed"]:
+            found.append(f"{result['target']} imports GUI modules: {', '.join(result['gui_modules'])}")
+    if baseline:
+        reference = {result["target"]: result for result in baseline["results"]}
+        for result in results["results"]:
+            previous = reference.get(result["target"])
+            if previous and previous["seconds"] > 0 and result["seconds"] > previous["seconds"] * (1 + threshold):
+                found.append(f"{result['target']}: {previous['seconds'] * 1000:.0f}ms -> "
+                             f"{result['seconds'] * 1000:.0f}ms ({result['seconds'] / previous['seconds']:.2f}x)")
+    return found
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time cold imports of the entry points in fresh interpreters.")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated targets")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default="import_benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag targets that got slower than a stored results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    targets = args.targets.split(",")
+    for name in targets:
+        if name not in TARGETS:
+            print(f"Error: unknown target {name}", file=sys.stderr)
+            return 1
+
+    def report(result):
+        gui = f" GUI: {', '.join(result['gui_modules'])}" if result["gui_modules"] else ""
+        print(f"{result['target']}: {result['seconds'] * 1000:.0f}ms, {result['modules']} modules{gui}",
+              file=sys.stderr)
+
+    results = run_benchmarks(targets, args.repeats, report)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    found = problems(results, baseline, args.threshold)
+    for problem in found:
+        print(f"PROBLEM {problem}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = {
+    "objects": {"engine": "reference"},
+    "arrays": {"engine": "population"},
+    "compact": {"engine": "population", "compact_storage": True},
+    "memmap": {"engine": "population", "compact_storage": True, "storage_directory": None, "chunk_size": 65536},
+}
+
+# Runs in a fresh interpreter: builds one automaton, steps a day and reports memory in bytes
+PROBE = """
+import json, resource, sys, threading, time
+
+def rss():
+    fields = {{}}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            fields[name] = int(value.split()[0]) * 1024 if value.strip().endswith("kB") else value
+    return fields.get("RssAnon", 0), fields.get("VmRSS", 0)
+
+from cell_automaton import CellAutomaton
+from config import Config
+
+peak_anon = [0]
+done = threading.Event()
+def sample():
+    # Polls anonymous memory, which memmap-backed arrays do not count towards
+    while not done.is_set():
+        peak_anon[0] = max(peak_anon[0], rss()[0])
+        time.sleep(0.001)
+
+baseline_anon, baseline_rss = rss()
+sampler = threading.Thread(target=sample, daemon=True)
+sampler.start()
+start = time.perf_counter()
+automaton = CellAutomaton(Config(**{options!r}))
+for iteration in range(1, {iterations} + 1):
+    automaton.update(iteration, iteration // automaton.config.iterations_per_day)
+elapsed = time.perf_counter() - start
+done.set()
+sampler.join()
+peak_anon[0] = max(peak_anon[0], rss()[0])
+automaton.close()
+print(json.dumps({{"baseline_anon": baseline_anon, "baseline_rss": baseline_rss, "peak_anon": peak_anon[0],
+                   "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, "seconds": elapsed}}))
+"""
+
+
+def measure(mode, cell_count, iterations, seed, density):
+    options = {"cell_count": cell_count, "infected_count": max(1, cell_count // 100), "seed": seed, **MODES[mode]}
+    # The square grows with the population so contacts per cell, and with them the infection pass's temporary
+    # pair arrays, stay the same at every size
+    side = math.sqrt(cell_count / density)
+    options["polygon_points"] = [(0, 0), (side, 0), (side, side), (0, side)]
+    with tempfile.TemporaryDirectory() as directory:
+        if "storage_directory" in options:
+            options["storage_directory"] = directory
+        output = subprocess.run([sys.executable, "-c", PROBE.format(options=options, iterations=iterations)],
+                                check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    sample = json.loads(output.strip().splitlines()[-1])
+    return {
+        "mode": mode,
+        "cell_count": cell_count,
+        "peak_rss": sample["peak_rss"],
+        "peak_anon": sample["peak_anon"],
+        # Growth over the interpreter with everything imported, per cell
+        "rss_per_cell": (sample["peak_rss"] - sample["baseline_rss"]) / cell_count,
+        "anon_per_cell": (sample["peak_anon"] - sample["baseline_anon"]) / cell_count,
+        "seconds": sample["seconds"],
+    }
+
+
+def run_benchmarks(modes, cell_counts, iterations=26, seed=0, density=0.02, max_object_cells=100000, report=None):
+    results = []
+    for mode in modes:
+        for cell_count in cell_counts:
+            if mode == "objects" and cell_count > max_object_cells:
+                continue
+            result = measure(mode, cell_count, iterations, seed, density)
+            results.append(result)
+            if report:
+                report(result)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "iterations": iterations,
+            "seed": seed,
+            "density": density,
+        },
+        "results": results,
+    }
+
+
+def _integers(text):
+    return [int(value) for value in text.split(",")]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure peak memory per cell for each population storage mode.")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated storage modes")
+    parser.add_argument("--cell-counts", type=_integers, default=[10000, 100000, 1000000])
+    parser.add_argument("--iterations", type=int, default=26, help="steps after seeding (26 is one default day)")
+    parser.add_argument("--max-object-cells", type=int, default=100000,
+                        help="skip larger populations of per-cell objects, which take minutes to build")
+    parser.add_argument("--density", type=float, default=0.02, help="cells per square pixel")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="memory_benchmark.json", help="JSON results file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    modes = args.modes.split(",")
+    for mode in modes:
+        if mode not in MODES:
+            print(f"Error: unknown mode {mode}", file=sys.stderr)
+            return 1
+
+    def report(result):
+        print(f"{result['mode']} n={result['cell_count']}: peak RSS {result['peak_rss'] / 2 ** 20:.1f} MiB "
+              f"({result['rss_per_cell']:.0f} B/cell), peak anonymous {result['peak_anon'] / 2 ** 20:.1f} MiB "
+              f"({result['anon_per_cell']:.0f} B/cell), {result['seconds']:.1f}s", file=sys.stderr)
+
+    results = run_benchmarks(modes, args.cell_counts, args.iterations, args.seed, args.density,
+                             args.max_object_cells, report)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
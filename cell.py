@@ -1,8 +1,5 @@
 import math
-import random
-
 import numpy as np
-import pygame
 from cell_state import CellState
 from shapely.geometry import Polygon, Point
 
@@ -11,11 +8,15 @@ class Cell:
     MAX_SPEED = 2.0
     SPEED_CHANGE_FACTOR = 0.01
 
-    def __init__(self, x, y, speed, size=3, infection_period=10):
+    def __init__(self, x, y, speed, size=3, infection_period=10, rng=None, on_state_change=None,
+                 contagiousness=None):
+        self.on_state_change = on_state_change
+        self.contagiousness = contagiousness if contagiousness is not None else self.prob_contagiousness
+        self.rng = rng if rng is not None else np.random.default_rng()
         self._x = x
         self._y = y
-        self._speed_x = random.uniform(-speed, speed)
-        self._speed_y = random.uniform(-speed, speed)
+        self._speed_x = self.rng.uniform(-speed, speed)
+        self._speed_y = self.rng.uniform(-speed, speed)
         self._state = CellState.HEALTHY
         self._infection_start_day = -1
         self.speed = speed
@@ -65,7 +66,9 @@ class Cell:
         else:
             self._infection_start_day = -1
 
-        self._state = new_state
+        old_state, self._state = self._state, new_state
+        if self.on_state_change:
+            self.on_state_change(old_state, new_state)
 
     def is_active(self):
         return self._state != CellState.DEAD
@@ -76,8 +79,8 @@ class Cell:
 
         # Update speed with random changes if randomization is enabled
         if self.randomize_movement:
-            self._speed_x += random.uniform(-self.SPEED_CHANGE_FACTOR, self.SPEED_CHANGE_FACTOR)
-            self._speed_y += random.uniform(-self.SPEED_CHANGE_FACTOR, self.SPEED_CHANGE_FACTOR)
+            self._speed_x += self.rng.uniform(-self.SPEED_CHANGE_FACTOR, self.SPEED_CHANGE_FACTOR)
+            self._speed_y += self.rng.uniform(-self.SPEED_CHANGE_FACTOR, self.SPEED_CHANGE_FACTOR)
 
         # Clamp speed
         self._speed_x = max(-self.MAX_SPEED, min(self._speed_x, self.MAX_SPEED))
@@ -99,9 +102,9 @@ class Cell:
             speed = math.sqrt(self._speed_x ** 2 + self._speed_y ** 2)
 
             # У 10% випадків додаємо випадкове збурення
-            if random.random() < 0.2:
-                self._speed_x += random.uniform(-0.5, 0.5)
-                self._speed_y += random.uniform(-0.5, 0.5)
+            if self.rng.random() < 0.2:
+                self._speed_x += self.rng.uniform(-0.5, 0.5)
+                self._speed_y += self.rng.uniform(-0.5, 0.5)
 
                 # Нормалізація швидкості, щоб зберігати її постійною
                 new_speed = math.sqrt(self._speed_x ** 2 + self._speed_y ** 2)
@@ -115,11 +118,11 @@ class Cell:
     def update_state(self, death_probability, latent_to_active_probability, current_day):
         self.current_day = current_day
         if self._state == CellState.LATENT:
-            if random.random() < latent_to_active_probability:
+            if self.rng.random() < latent_to_active_probability:
                 self.set_state(CellState.ACTIVE)
         elif self._state == CellState.ACTIVE:
             if current_day - self._infection_start_day >= self.infection_period:
-                if random.random() < death_probability:
+                if self.rng.random() < death_probability:
                     self.set_state(CellState.DEAD)
                 else:
                     self.set_state(CellState.LATENT)
@@ -132,12 +135,12 @@ class Cell:
         return False
 
     def infect(self, infection_prob_healthy, infection_prob_latent, infection_probability):
-        if random.random() < infection_probability:
+        if self.rng.random() < infection_probability:
             if self.state == CellState.HEALTHY:
-                if random.random() < infection_prob_healthy:
+                if self.rng.random() < infection_prob_healthy:
                     self.set_state(CellState.ACTIVE)
             elif self.state == CellState.LATENT:
-                if random.random() < infection_prob_latent:
+                if self.rng.random() < infection_prob_latent:
                     self.set_state(CellState.ACTIVE)
 
     def show_radius(self):
@@ -145,6 +148,8 @@ class Cell:
 
     def draw(self, screen, color_healthy, color_latent, color_active, color_dead, show_radius, infection_radius, scale,
              offset_x, offset_y):
+        import pygame
+
         if self.state == CellState.DEAD:
             color = color_dead
         elif self.state == CellState.LATENT:
@@ -192,6 +197,4 @@ class Cell:
 
     def calculate_infection_probability(self):
         day_of_infection = self.current_day - self._infection_start_day
-        print(self, self.state, self._infection_start_day, self.prob_contagiousness(day_of_infection))
-        return self.prob_contagiousness(day_of_infection)
-
+        return self.contagiousness(day_of_infection)
@@ -1,44 +1,183 @@
-import random
+import logging
+import math
 from collections import defaultdict
 from cell import Cell
+from cell_population import CellPopulation
 from cell_state import CellState
-from config import Config
-import pygame
-from shapely.geometry import Polygon, Point
+from config import DEFAULT_CHUNK_SIZE, Config
+from infection_log import InfectionLog
+from profiler import Profiler
+from spatial_grid import SpatialGrid
+from region import Region
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+ENGINES = ("auto", "population", "numba", "parallel", "reference")
+
+# Importing numba and loading its cached kernels costs over half a second, more than it saves on small populations
+AUTO_NUMBA_MIN_CELLS = 2000
+
+
+def resolve_engine(engine, cell_count=None):
+    # "auto" picks the compiled engine when numba is installed and the population is large enough to repay loading
+    # it; both engines share one random stream, so the choice never changes a seeded run
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    if engine != "auto":
+        return engine
+    if cell_count is not None and cell_count < AUTO_NUMBA_MIN_CELLS:
+        return "population"
+    import numba_population
+    return "numba" if numba_population.AVAILABLE else "population"
+
+
 class CellAutomaton:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, cell_arrays=None, profiler=None):
         self.config = config
+        self.profiler = profiler if profiler is not None else Profiler()
         self.width = 600
         self.height = 400
-        self.polygon = Polygon(self.config.polygon_points)
+        self.region = Region(self.config.polygon_points, mask_resolution=self.config.containment_resolution)
+        self.polygon = self.region.polygon
         self.offset_x = 0
         self.offset_y = 0
         self.scale = 1
-        self.cells = self._initialize_cells()
+        self.engine = resolve_engine(self.config.engine, self.config.cell_count)
+        self.rng = np.random.default_rng(self.config.seed)
+        self.contagiousness = self.config.contagiousness_table()
+        self.spatial_grid = SpatialGrid(self.config.infection_radius or 1)
+        self.state_counts = dict.fromkeys(CellState, 0)
+        self.state_counts[CellState.HEALTHY] = self.config.cell_count
+        # Needed before seeding, whose state changes go through _on_state_change; cleared again once it is done
+        self.daily_statistics = {"infected": 0, "dead": 0}
+        self.current_day = 0
+        self.current_iteration = 0
+        # Who infected whom, with R_t and generation-interval estimates updated as each day closes
+        self.infection_log = InfectionLog(self.contagiousness(np.arange(max(self.config.infection_period, 1))))
+        if self.engine == "reference":
+            self.cells = self._initialize_cells(cell_arrays)
+            self.population = None
+        else:
+            self.cells = []
+            self.population = self._initialize_population(cell_arrays)
+            self.population.on_infection = self._on_infection
+        if cell_arrays is None:
+            # Seeded cells are day 0's onsets, the first generation the estimates count
+            self.infection_log.close_day(0, self.state_counts[CellState.ACTIVE])
         self.infection_check_timer = defaultdict(lambda: -float('inf'))
         self.running = True
         self.update_counter = 0
+        # Seeding transitions are not incidence, so drop what they counted
         self.daily_statistics = {"infected": 0, "dead": 0}
         self._initialize_colors()
-        self.current_day = 0
         self.show_radius = False
+        self.renderer = None
+        self.infection_attempts = 0
 
-    def _initialize_cells(self):
-        cells = []
-        while len(cells) < self.config.cell_count:
-            x = random.uniform(self.polygon.bounds[0], self.polygon.bounds[2])
-            y = random.uniform(self.polygon.bounds[1], self.polygon.bounds[3])
-            if self.polygon.contains(Point(x, y)):
-                cell = Cell(x, y, self.config.cell_speed, size=self.config.cell_size, infection_period=self.config.infection_period)
-                cells.append(cell)
+    def _initialize_cells(self, cell_arrays=None):
+        if cell_arrays is not None:
+            return self._restore_cells(cell_arrays)
+
+        xs, ys = self.region.sample(self.config.cell_count, self.rng)
+        cells = [Cell(x, y, self.config.cell_speed, size=self.config.cell_size, infection_period=self.config.infection_period,
+                      rng=self.rng, on_state_change=self._on_state_change, contagiousness=self.contagiousness)
+                 for x, y in zip(xs.tolist(), ys.tolist())]
         for i in range(self.config.infected_count):
             cells[i].set_state(CellState.ACTIVE)
         for i in range(round(self.config.cell_count * self.config.latent_prob)):
             cells[i + self.config.infected_count].set_state(CellState.LATENT)
         return cells
 
+    def _initialize_population(self, cell_arrays=None):
+        chunk_size = self.config.resolved_chunk_size()
+        if cell_arrays is not None:
+            xs, ys = cell_arrays["x"], cell_arrays["y"]
+        elif chunk_size:
+            # Placed chunk by chunk below instead of sampling every position at once
+            xs = ys = np.broadcast_to(np.float64(0), (self.config.cell_count,))
+        else:
+            xs, ys = self.region.sample(self.config.cell_count, self.rng)
+        options = {"compact": self.config.compact_storage, "storage_directory": self.config.storage_directory,
+                   "chunk_size": chunk_size}
+        if self.engine == "numba":
+            from numba_population import NumbaCellPopulation as population_class
+        elif self.engine == "parallel":
+            from parallel_population import ParallelCellPopulation as population_class
+            options["config"] = self.config
+        else:
+            population_class = CellPopulation
+        population = population_class(xs, ys, self.config.cell_speed, size=self.config.cell_size,
+                                      infection_period=self.config.infection_period, rng=self.rng,
+                                      on_state_change=self._on_state_change, **options)
+        if cell_arrays is not None:
+            population.load_arrays(cell_arrays)
+            self._count_states(population.state)
+            return population
+        if chunk_size:
+            for chunk in population.chunks():
+                population.place(chunk, *self.region.sample(chunk.stop - chunk.start, self.rng))
+
+        infected_count = self.config.infected_count
+        latent_count = round(self.config.cell_count * self.config.latent_prob)
+        population.set_state(np.arange(infected_count), CellState.ACTIVE)
+        population.set_state(np.arange(infected_count, infected_count + latent_count), CellState.LATENT)
+        return population
+
+    def _restore_cells(self, cell_arrays):
+        cells = []
+        for i in range(len(cell_arrays["x"])):
+            cell = Cell(float(cell_arrays["x"][i]), float(cell_arrays["y"][i]), self.config.cell_speed,
+                        size=self.config.cell_size, infection_period=self.config.infection_period, rng=self.rng,
+                        on_state_change=self._on_state_change, contagiousness=self.contagiousness)
+            cell._speed_x = float(cell_arrays["speed_x"][i])
+            cell._speed_y = float(cell_arrays["speed_y"][i])
+            cell._state = CellState(int(cell_arrays["state"][i]))
+            cell._infection_start_day = int(cell_arrays["infection_start_day"][i])
+            cell._infection_alpha = int(cell_arrays["infection_alpha"][i])
+            cells.append(cell)
+        self._count_states(cell_arrays["state"])
+        return cells
+
+    def _count_states(self, states):
+        # In chunks, since bincount widens every state to intp
+        counts = sum(np.bincount(states[start:start + DEFAULT_CHUNK_SIZE], minlength=CellState.DEAD.value + 1)
+                     for start in range(0, max(len(states), 1), DEFAULT_CHUNK_SIZE))
+        self.state_counts = {state: int(counts[state.value]) for state in CellState}
+
+    def get_cell_arrays(self):
+        if self.population is not None:
+            return self.population.to_arrays()
+        return {
+            "x": np.array([cell.x for cell in self.cells], dtype=np.float64),
+            "y": np.array([cell.y for cell in self.cells], dtype=np.float64),
+            "speed_x": np.array([cell._speed_x for cell in self.cells], dtype=np.float64),
+            "speed_y": np.array([cell._speed_y for cell in self.cells], dtype=np.float64),
+            "state": np.array([cell.state.value for cell in self.cells], dtype=np.int8),
+            "infection_start_day": np.array([cell.infection_start_day for cell in self.cells], dtype=np.int64),
+            "infection_alpha": np.array([cell._infection_alpha for cell in self.cells], dtype=np.int16),
+        }
+
+    def restore_day(self, current_day):
+        self.current_day = current_day
+        if self.population is not None:
+            self.population.current_day = current_day
+        for cell in self.cells:
+            cell.current_day = current_day
+
+    def _on_state_change(self, old_state, new_state, count=1):
+        self.state_counts[old_state] -= count
+        self.state_counts[new_state] += count
+        if new_state == CellState.ACTIVE:
+            self.daily_statistics["infected"] += count
+        elif new_state == CellState.DEAD:
+            self.daily_statistics["dead"] += count
+
+    def _on_infection(self, infectors, infectees, prior_states):
+        ages = self.current_day - self.population.infection_start_day[infectors]
+        self.infection_log.append(self.current_day, self.current_iteration, infectors, infectees, prior_states,
+                                  self.contagiousness(ages), ages)
+
     def _initialize_colors(self):
         self.color_healthy = self.config.color_healthy
         self.color_latent = self.config.color_latent
@@ -48,67 +187,208 @@ class CellAutomaton:
 
     def update(self, current_iteration, current_day):
         self.current_day = current_day
+        self.current_iteration = current_iteration
+
+        profiler = self.profiler
 
         # Call _update_infections once a day
         if current_iteration % self.config.iterations_per_day == 0:
-            self._update_cells()
+            with profiler.measure("update"):
+                self._update_cells()
 
         # Call _spread_infections infection_checks_per_day times a day
         if current_iteration % self.config.infection_checks_per_iter == 0:
-            self._spread_infections()
+            if profiler.enabled:
+                self._profile_spread()
+            else:
+                self._spread_infections()
 
-        self._move_cells()
+        with profiler.measure("move"):
+            self._move_cells()
+        # Every live cell tests its next position against the polygon once per move
+        profiler.count("containment_checks", self.config.cell_count - self.state_counts[CellState.DEAD])
+
+    def _profile_spread(self):
+        candidates = self.spatial_grid.candidates_tested
+        attempts = self.infection_attempts
+        infected = self.daily_statistics["infected"]
+        with self.profiler.measure("spread"):
+            self._spread_infections()
+        self.profiler.count("candidate_pairs", self.spatial_grid.candidates_tested - candidates)
+        self.profiler.count("infection_attempts", self.infection_attempts - attempts)
+        self.profiler.count("infections", self.daily_statistics["infected"] - infected)
 
     def _update_cells(self):
+        if self.population is not None:
+            self.population.update_state(self.config.death_probability, self.config.latent_to_active_prob,
+                                         self.current_day)
+            return
         for cell in self.cells:
             cell.update_state(self.config.death_probability, self.config.latent_to_active_prob, self.current_day)
 
     def _move_cells(self):
+        if self.population is not None:
+            self.population.move(self.region)
+            return
         for cell in self.cells:
             cell.move(self.polygon)
 
     def _spread_infections(self):
+        if self.population is not None:
+            if not logger.isEnabledFor(logging.DEBUG):
+                self.infection_attempts += self.population.spread(
+                    self.spatial_grid, self.config.infection_radius, self.config.infection_prob_healthy,
+                    self.config.infection_prob_latent, self.contagiousness)
+                return
+            sources, targets = self.population.pairs_within(self.spatial_grid, self.config.infection_radius)
+            self.infection_attempts += sources.size
+            self._trace_infection_attempts(sources, targets)
+            self.population.infect(sources, targets, self.config.infection_prob_healthy,
+                                   self.config.infection_prob_latent, self.contagiousness)
+            return
+
         positions = np.array([(cell.x, cell.y) for cell in self.cells])
-        states = np.array([cell.state for cell in self.cells])
-        infection_radius_sq = self.config.infection_radius ** 2
+        self.spatial_grid.rebuild(positions[:, 0], positions[:, 1])
+        trace = logger.isEnabledFor(logging.DEBUG)
+        infections = []
 
         for i, cell in enumerate(self.cells):
             if cell.state == CellState.ACTIVE:
-                distances_sq = np.sum((positions - positions[i]) ** 2, axis=1)
-                within_radius = (distances_sq <= infection_radius_sq) & (distances_sq > 0)
-                for j in np.where(within_radius)[0]:
+                for j in np.sort(self.spatial_grid.query_radius(cell.x, cell.y, self.config.infection_radius)):
                     other_cell = self.cells[j]
-                    if cell.can_infect(other_cell, self.config.infection_radius):
-                        other_cell.infect(self.config.infection_prob_healthy, self.config.infection_prob_latent, cell.calculate_infection_probability())
+                    if other_cell is not cell and cell.can_infect(other_cell, self.config.infection_radius):
+                        self.infection_attempts += 1
+                        probability = cell.calculate_infection_probability()
+                        if trace:
+                            logger.debug("infection attempt", extra={
+                                "day": self.current_day, "infector": i, "target": int(j),
+                                "target_state": other_cell.state.name, "probability": float(probability)})
+                        prior_state = other_cell.state
+                        other_cell.infect(self.config.infection_prob_healthy, self.config.infection_prob_latent, probability)
+                        if other_cell.state == CellState.ACTIVE:
+                            infections.append((i, int(j), prior_state.value, probability,
+                                               self.current_day - cell.infection_start_day))
                         cell.show_radius()
+        if infections:
+            infectors, infectees, prior_states, probabilities, ages = zip(*infections)
+            self.infection_log.append(self.current_day, self.current_iteration, infectors, infectees, prior_states,
+                                      probabilities, ages)
+
+    def _trace_infection_attempts(self, sources, targets):
+        days = self.current_day - self.population.infection_start_day[sources]
+        probabilities = self.contagiousness(days)
+        for source, target, probability in zip(sources.tolist(), targets.tolist(), probabilities.tolist()):
+            logger.debug("infection attempt", extra={
+                "day": self.current_day, "infector": source, "target": target,
+                "target_state": CellState(int(self.population.state[target])).name, "probability": probability})
 
     def draw(self, screen):
-        screen.fill(self.background_color)
+        self.draw_snapshot(screen, self.snapshot())
+
+    def snapshot(self):
+        # Copies of what a frame shows, so a caller can hold the model's lock for the copy and render after releasing
+        # it; the radius fade is applied here, since it changes the model's arrays
+        x, y, states = (np.array(values) for values in self.get_positions_and_states())
+        alpha = None
+        if self.show_radius:
+            if self.population is not None:
+                alpha = self.population.infection_alpha.copy()
+            else:
+                alpha = np.fromiter((cell._infection_alpha for cell in self.cells), dtype=np.int16,
+                                    count=len(self.cells))
+            self._fade_infection_radius()
+        return x, y, states, alpha
 
-        scaled_points = [
-            (
-                (x * self.scale + self.offset_x),
-                (y * self.scale + self.offset_y)
-            )
-            for x, y in self.polygon.exterior.coords
-        ]
-        pygame.draw.polygon(screen, (255, 255, 255), scaled_points, 1)
+    def draw_snapshot(self, screen, snapshot):
+        with self.profiler.measure("draw"):
+            if self.renderer is None:
+                # Imported lazily so headless runs never load pygame
+                from cell_renderer import CellRenderer
+                self.renderer = CellRenderer()
+            x, y, states, alpha = snapshot
+            self.renderer.draw_scene(screen, self.config, self.polygon.exterior.coords, x, y, states, alpha,
+                                     self.scale, self.offset_x, self.offset_y, alpha is not None)
 
+    def get_positions_and_states(self):
+        if self.population is not None:
+            return self.population.x, self.population.y, self.population.state
+        x = np.fromiter((cell.x for cell in self.cells), dtype=np.float64, count=len(self.cells))
+        y = np.fromiter((cell.y for cell in self.cells), dtype=np.float64, count=len(self.cells))
+        states = np.fromiter((cell.state.value for cell in self.cells), dtype=np.int8, count=len(self.cells))
+        return x, y, states
+
+    def _fade_infection_radius(self):
+        if self.population is not None:
+            alpha = self.population.infection_alpha
+            # Subtracting at most the current value keeps unsigned compact alphas from wrapping around
+            np.subtract(alpha, np.minimum(alpha, 10).astype(alpha.dtype), out=alpha)
+            return
         for cell in self.cells:
-            cell.draw(screen, self.color_healthy, self.color_latent, self.color_active, self.color_dead,
-                      self.show_radius, self.config.infection_radius, self.scale, self.offset_x, self.offset_y)
+            if cell._infection_alpha > 0:
+                cell._infection_alpha = max(0, cell._infection_alpha - 10)
+
+    def idle_until(self):
+        # None while something can still happen (or the engine cannot tell); otherwise the first day a latent cell
+        # reactivates, or math.inf if none ever will
+        if not self.no_infected():
+            return None
+        probability = self.config.latent_to_active_prob
+        if self.population is None:
+            if self.state_counts[CellState.LATENT] and probability > 0:
+                return None
+            return math.inf
+        day = self.population.next_activation_day(probability, self.current_day + 1)
+        return math.inf if day is None else day
+
+    def mixing_days(self):
+        # Days a cell needs to cross the polygon's bounding box at cell_speed per step
+        min_x, min_y, max_x, max_y = self.region.bounds
+        distance = math.hypot(max_x - min_x, max_y - min_y)
+        return max(1, math.ceil(distance / (max(self.config.cell_speed, 1e-9) * self.config.iterations_per_day)))
+
+    def fast_forward(self, last_day=math.inf):
+        # Called at a day boundary. With nobody infectious, moves are the only work until the next reactivation, so
+        # jump the clock to the day before it (or last_day) and draw positions from the stationary distribution of
+        # the bouncing walk, uniform over the polygon. Gaps too short for cells to mix are stepped normally.
+        idle_until = self.idle_until()
+        if idle_until is None:
+            return None
+        target = min(idle_until - 1, last_day)
+        if target == math.inf or target - self.current_day < self.mixing_days():
+            return None
+        target = int(target)
+
+        if self.population is not None:
+            population = self.population
+            for chunk in population.chunks():
+                alive = chunk.start + np.flatnonzero(population.state[chunk] != CellState.DEAD.value)
+                population.place(alive, *self.region.sample(alive.size, self.rng))
+        else:
+            alive = [cell for cell in self.cells if cell.is_active()]
+            xs, ys = self.region.sample(len(alive), self.rng)
+            for cell, x, y in zip(alive, xs.tolist(), ys.tolist()):
+                cell._x, cell._y = x, y
+        self.profiler.count("fast_forward_days", target - self.current_day)
+        for day in range(self.current_day + 1, target + 1):
+            self.infection_log.close_day(day, 0)
+        self.restore_day(target)
+        return target
+
+    def close(self):
+        # Releases worker processes and shared memory held by the parallel engine, or a population's memmap files
+        if self.population is not None:
+            self.population.close()
 
     def get_statistics(self):
-        healthy = len([c for c in self.cells if c.state == CellState.HEALTHY])
-        infected = len([c for c in self.cells if c.state == CellState.ACTIVE])
-        latent = len([c for c in self.cells if c.state == CellState.LATENT])
-        dead = len([c for c in self.cells if c.state == CellState.DEAD])
-        return healthy, infected, latent, dead
+        counts = self.state_counts
+        return counts[CellState.HEALTHY], counts[CellState.ACTIVE], counts[CellState.LATENT], counts[CellState.DEAD]
 
     def reset_daily_statistics(self):
         daily_stats = self.daily_statistics.copy()
         self.daily_statistics = {"infected": 0, "dead": 0}
+        daily_stats["r_t"], daily_stats["generation_interval"] = self.infection_log.close_day(self.current_day,
+                                                                                              daily_stats["infected"])
         return daily_stats
 
     def no_infected(self):
-        return all(cell.state != CellState.ACTIVE for cell in self.cells)
\ No newline at end of file
+        return self.state_counts[CellState.ACTIVE] == 0
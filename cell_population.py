@@ -0,0 +1,352 @@
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+from cell import Cell
+from cell_state import CellState
+from event_calendar import EventCalendar
+
+HEALTHY = CellState.HEALTHY.value
+LATENT = CellState.LATENT.value
+ACTIVE = CellState.ACTIVE.value
+DEAD = CellState.DEAD.value
+
+# 51 bytes per cell
+DTYPES = {
+    "x": np.float64, "y": np.float64, "speed_x": np.float64, "speed_y": np.float64, "state": np.int8,
+    "infection_start_day": np.int64, "infection_alpha": np.int16, "activation_day": np.int64,
+}
+# 26 bytes per cell; float32 keeps positions to about 1e-5 of a 600-unit polygon
+COMPACT_DTYPES = {
+    "x": np.float32, "y": np.float32, "speed_x": np.float32, "speed_y": np.float32, "state": np.uint8,
+    "infection_start_day": np.int32, "infection_alpha": np.uint8, "activation_day": np.int32,
+}
+FILL_VALUES = {"state": HEALTHY, "infection_start_day": -1, "activation_day": -1}
+
+
+class CellPopulation:
+    MAX_SPEED = Cell.MAX_SPEED
+    SPEED_CHANGE_FACTOR = Cell.SPEED_CHANGE_FACTOR
+
+    VALID_TRANSITIONS = {
+        HEALTHY: (ACTIVE, LATENT),
+        ACTIVE: (LATENT, DEAD),
+        LATENT: (ACTIVE,),
+        DEAD: (),
+    }
+
+    def __init__(self, x, y, speed, size=3, infection_period=10, rng=None, on_state_change=None, compact=False,
+                 storage_directory=None, chunk_size=None):
+        self.on_state_change = on_state_change
+        # Called as on_infection(infectors, infectees, prior_states) for every pass that infects someone
+        self.on_infection = None
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.dtypes = COMPACT_DTYPES if compact else DTYPES
+        # With a storage directory every array is a memmap file there, so only the working set of one chunk has
+        # to fit in memory; moves and susceptible scans then visit at most chunk_size cells at a time
+        self.chunk_size = chunk_size
+        self._storage = None
+        self._storage_finalizer = None
+        if storage_directory is not None:
+            os.makedirs(storage_directory, exist_ok=True)
+            self._storage = tempfile.mkdtemp(prefix="cells-", dir=storage_directory)
+            self._storage_finalizer = weakref.finalize(self, shutil.rmtree, self._storage, True)
+        count = len(x)
+        for name in self.ARRAYS:
+            setattr(self, name, self._allocate(name, count))
+        # Day a LATENT cell is due to turn ACTIVE (activation_day) is -1 while none is drawn
+        for chunk in self.chunks():
+            self.x[chunk] = x[chunk]
+            self.y[chunk] = y[chunk]
+            self.speed_x[chunk], self.speed_y[chunk] = self.rng.uniform(-speed, speed, (2, chunk.stop - chunk.start))
+        self.speed = speed
+        self.size = size
+        self.infection_period = infection_period
+        self.randomize_movement = True
+        self.current_day = 0
+        # Daily transitions come from two calendars instead of a scan of every cell: recoveries are due
+        # infection_period days after activation, and each LATENT cell gets one geometric waiting time
+        self._recoveries = EventCalendar()
+        self._activations = EventCalendar()
+        self._pending_latent = []
+        self._latent_probability = None
+        self.active_cells = np.empty(0, dtype=np.intp)
+
+    ARRAYS = tuple(DTYPES)
+
+    def _allocate(self, name, count):
+        dtype = self.dtypes[name]
+        fill = FILL_VALUES.get(name, 0)
+        if self._storage is None:
+            return np.full(count, fill, dtype=dtype)
+        # New memmap files read as zeros; mapping an empty file is not allowed
+        array = np.memmap(os.path.join(self._storage, f"{name}.dat"), dtype=dtype, mode="w+", shape=(max(count, 1),))
+        array = array[:count]
+        if fill:
+            for chunk in self.chunks(count):
+                array[chunk] = fill
+        return array
+
+    def chunks(self, count=None):
+        count = len(self) if count is None else count
+        step = self.chunk_size or max(count, 1)
+        return [slice(start, min(start + step, count)) for start in range(0, max(count, 1), step)]
+
+    def close(self):
+        # Deletes the memmap files of a storage-backed population
+        if self._storage_finalizer is not None:
+            self._storage_finalizer()
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def load_arrays(self, arrays):
+        # Copied into the existing arrays, so memmap backing and compact dtypes are kept. Checkpoints from before
+        # activation days were stored keep the defaults and get waits drawn afresh
+        for name in self.ARRAYS:
+            if name in arrays:
+                getattr(self, name)[:] = arrays[name]
+        self.reindex()
+
+    def use_arrays(self, arrays):
+        # Adopts the given arrays without copying, e.g. views onto shared memory
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.reindex()
+
+    def reindex(self):
+        # Rebuilds the active index and both calendars after the arrays were replaced or edited directly
+        self.active_cells = np.flatnonzero(self.state == ACTIVE)
+        self._recoveries.clear()
+        self._recoveries.schedule(self.infection_start_day[self.active_cells] + self.infection_period,
+                                  self.active_cells)
+        latent = np.flatnonzero(self.state == LATENT)
+        drawn = self.activation_day[latent] >= 0
+        self._activations.clear()
+        self._activations.schedule(self.activation_day[latent[drawn]], latent[drawn])
+        self._pending_latent = [latent[~drawn]]
+
+    def __len__(self):
+        return len(self.x)
+
+    def set_state(self, indices, new_state):
+        indices = np.asarray(indices, dtype=np.intp)
+        new_state = CellState(new_state).value
+        current = self.state[indices]
+        allowed = np.array([new_state in self.VALID_TRANSITIONS[s] for s in range(HEALTHY, DEAD + 1)])
+        invalid = ~allowed[current - HEALTHY]
+        if invalid.any():
+            bad = CellState(int(current[invalid][0]))
+            raise ValueError(f"Invalid state transition: {bad} to {CellState(new_state)}")
+
+        if new_state == ACTIVE:
+            self.infection_start_day[indices] = self.current_day
+            self._recoveries.schedule(np.full(indices.size, self.current_day + self.infection_period), indices)
+            self.active_cells = np.union1d(self.active_cells, indices)
+        else:
+            self.infection_start_day[indices] = -1
+            leaving = indices[current == ACTIVE]
+            if leaving.size:
+                self.active_cells = np.setdiff1d(self.active_cells, leaving, assume_unique=True)
+
+        self.activation_day[indices] = -1
+        if new_state == LATENT:
+            self._pending_latent.append(indices)
+
+        self.state[indices] = new_state
+
+        if self.on_state_change and indices.size:
+            for old_state, count in enumerate(np.bincount(current, minlength=DEAD + 1)):
+                if count:
+                    self.on_state_change(CellState(old_state), CellState(new_state), int(count))
+
+    def place(self, cells, x, y):
+        # Positions set outside move, e.g. scattering cells at seeding or after a fast-forward
+        self.x[cells] = x
+        self.y[cells] = y
+
+    def move(self, region, cells=None):
+        if cells is not None:
+            self._move(region, cells[self.state[cells] != DEAD])
+            return
+        for chunk in self.chunks():
+            self._move(region, chunk.start + np.flatnonzero(self.state[chunk] != DEAD))
+
+    def _move(self, region, alive):
+        if alive.size == 0:
+            return
+
+        speed_x = self.speed_x[alive]
+        speed_y = self.speed_y[alive]
+
+        if self.randomize_movement:
+            change_x, change_y = self.rng.uniform(-self.SPEED_CHANGE_FACTOR, self.SPEED_CHANGE_FACTOR, (2, alive.size))
+            speed_x += change_x
+            speed_y += change_y
+
+        np.clip(speed_x, -self.MAX_SPEED, self.MAX_SPEED, out=speed_x)
+        np.clip(speed_y, -self.MAX_SPEED, self.MAX_SPEED, out=speed_y)
+
+        new_x = self.x[alive] + speed_x
+        new_y = self.y[alive] + speed_y
+        inside = region.contains(new_x, new_y)
+
+        self.x[alive[inside]] = new_x[inside]
+        self.y[alive[inside]] = new_y[inside]
+
+        # Cells that would leave the polygon stay put and either bounce back or get a random nudge
+        outside = ~inside
+        if outside.any():
+            bounce_x = speed_x[outside]
+            bounce_y = speed_y[outside]
+            speed = np.hypot(bounce_x, bounce_y)
+
+            perturb = self.rng.random(bounce_x.size) < 0.2
+            nudge_x, nudge_y = self.rng.uniform(-0.5, 0.5, (2, perturb.sum()))
+            bounce_x[perturb] += nudge_x
+            bounce_y[perturb] += nudge_y
+            new_speed = np.hypot(bounce_x[perturb], bounce_y[perturb])
+            ratio = np.divide(speed[perturb], new_speed, out=np.ones_like(new_speed), where=new_speed > 0)
+            bounce_x[perturb] *= ratio
+            bounce_y[perturb] *= ratio
+
+            bounce_x[~perturb] = -bounce_x[~perturb]
+            bounce_y[~perturb] = -bounce_y[~perturb]
+
+            speed_x[outside] = bounce_x
+            speed_y[outside] = bounce_y
+
+        self.speed_x[alive] = speed_x
+        self.speed_y[alive] = speed_y
+
+    def update_state(self, death_probability, latent_to_active_probability, current_day):
+        self.current_day = current_day
+        self._draw_activations(latent_to_active_probability, current_day)
+
+        # Calendar entries may be stale (a latent cell reinfected, an active one reactivated), so re-check them
+        activated = self._activations.pop_due(current_day)
+        activation_day = self.activation_day[activated]
+        activated = np.unique(activated[(self.state[activated] == LATENT) & (activation_day >= 0)
+                                        & (activation_day <= current_day)])
+
+        due = self._recoveries.pop_due(current_day)
+        due = np.unique(due[(self.state[due] == ACTIVE)
+                            & (current_day - self.infection_start_day[due] >= self.infection_period)])
+        dies = self.rng.random(due.size) < death_probability
+
+        self.set_state(activated, CellState.ACTIVE)
+        self.set_state(due[dies], CellState.DEAD)
+        self.set_state(due[~dies], CellState.LATENT)
+
+    def next_activation_day(self, probability, next_day):
+        # Waits for cells that turned latent since the last update are drawn now rather than on next_day; entries may
+        # be stale, which only makes the answer early
+        self._draw_activations(probability, next_day)
+        return self._activations.next_day()
+
+    def _draw_activations(self, probability, current_day):
+        if self._latent_probability is not None and probability != self._latent_probability:
+            # Waits drawn for the old probability no longer apply; geometric waits are memoryless, so redraw them all
+            self._activations.clear()
+            latent = np.flatnonzero(self.state == LATENT)
+            self.activation_day[latent] = -1
+            self._pending_latent = [latent]
+        self._latent_probability = probability
+
+        pending, self._pending_latent = self._pending_latent, []
+        if probability <= 0 or not pending:
+            return
+        pending = np.unique(np.concatenate(pending))
+        pending = pending[(self.state[pending] == LATENT) & (self.activation_day[pending] < 0)]
+        # Trial k of the wait is the update on day current_day - 1 + k, the same daily draw the scan used to make
+        days = current_day - 1 + self.rng.geometric(probability, pending.size)
+        self.activation_day[pending] = days
+        self._activations.schedule(days, pending)
+
+    def pairs_within(self, grid, infection_radius, infectors=None, susceptible=None):
+        if infectors is None:
+            infectors = self.active_cells
+        if susceptible is None:
+            susceptible = self.susceptible_cells(infectors, infection_radius)
+        if infectors.size == 0 or susceptible.size == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        grid.rebuild(self.x[susceptible], self.y[susceptible], susceptible)
+        if self.chunk_size is None:
+            return grid.pairs_within(self.x[infectors], self.y[infectors], infection_radius, infectors)
+
+        # Candidate arrays grow with infectors times neighbours, so query a batch of infectors at a time; pairs come
+        # back ordered by infector either way
+        batch = max(1, self.chunk_size // self.INFECTOR_BATCH_DIVISOR)
+        pairs = [grid.pairs_within(self.x[part], self.y[part], infection_radius, part)
+                 for part in np.array_split(infectors, -(-infectors.size // batch))]
+        return np.concatenate([sources for sources, _ in pairs]), np.concatenate([targets for _, targets in pairs])
+
+    # Infectors per query batch in chunked mode, as a fraction of chunk_size: each one tests dozens to hundreds of
+    # candidates in a dense crowd
+    INFECTOR_BATCH_DIVISOR = 64
+
+    def susceptible_cells(self, infectors=None, infection_radius=None):
+        if self.chunk_size is None:
+            return np.flatnonzero((self.state == HEALTHY) | (self.state == LATENT))
+
+        # Chunked: only cells in a radius-sized bucket next to an infector's can be reached, so the grid never holds
+        # the whole population. The grid then yields the same set of pairs, grouped by infector in the same order; the
+        # targets within one infector's group may come in another order, since the grid's buckets start at the
+        # smallest coordinates it indexes
+        near = None
+        if infectors is not None and infection_radius:
+            if infectors.size == 0:
+                return np.empty(0, dtype=np.intp)
+            keys = self._bucket_keys(infectors, infection_radius)
+            near = np.unique((keys[:, None] + self._NEIGHBOUR_KEYS[None, :]).ravel())
+        parts = []
+        for chunk in self.chunks():
+            state = self.state[chunk]
+            indices = chunk.start + np.flatnonzero((state == HEALTHY) | (state == LATENT))
+            if near is not None:
+                indices = indices[np.isin(self._bucket_keys(indices, infection_radius), near)]
+            parts.append(indices)
+        return np.concatenate(parts)
+
+    _NEIGHBOUR_KEYS = np.array([dx * 2 ** 32 + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+
+    def _bucket_keys(self, indices, size):
+        column = np.floor(self.x[indices] / size).astype(np.int64)
+        row = np.floor(self.y[indices] / size).astype(np.int64)
+        return column * 2 ** 32 + row
+
+    def spread(self, grid, infection_radius, infection_prob_healthy, infection_prob_latent, contagiousness):
+        sources, targets = self.pairs_within(grid, infection_radius)
+        self.infect(sources, targets, infection_prob_healthy, infection_prob_latent, contagiousness)
+        return sources.size
+
+    def infect(self, sources, targets, infection_prob_healthy, infection_prob_latent, contagiousness):
+        infected, infectors = self.draw_infections(sources, targets, infection_prob_healthy, infection_prob_latent,
+                                                   contagiousness)
+        self.apply_infections(infected, infectors)
+        return infected
+
+    def apply_infections(self, infected, infectors):
+        # Reported before the state changes, so on_infection still sees what each infectee was
+        if self.on_infection and infected.size:
+            self.on_infection(infectors, infected, self.state[infected])
+        self.set_state(infected, CellState.ACTIVE)
+
+    def draw_infections(self, sources, targets, infection_prob_healthy, infection_prob_latent, contagiousness):
+        if sources.size == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        self.infection_alpha[np.unique(sources)] = 255
+
+        days = self.current_day - self.infection_start_day[sources]
+        target_prob = np.where(self.state[targets] == HEALTHY, infection_prob_healthy, infection_prob_latent)
+        probability = contagiousness(days) * target_prob
+
+        # A target is infected if any of its contacts succeeds, as with sequential Cell.infect calls; the first
+        # successful contact is credited with it
+        hits = self.rng.random(targets.size) < probability
+        infected, first = np.unique(targets[hits], return_index=True)
+        return infected, sources[hits][first]
@@ -0,0 +1,68 @@
+import math
+
+import numpy as np
+import pygame
+from cell_state import CellState
+
+
+class CellRenderer:
+    RING_COLOR = (255, 0, 0)
+
+    def __init__(self):
+        self._sprites = {}
+        self._overlay = None
+
+    def _sprite(self, color, radius):
+        key = (tuple(color), radius)
+        if key not in self._sprites:
+            centre = math.ceil(radius)
+            sprite = pygame.Surface((2 * centre + 1, 2 * centre + 1))
+            # Any colour other than the cell's own works as the transparent key
+            colorkey = tuple(255 - c for c in color[:3])
+            sprite.fill(colorkey)
+            sprite.set_colorkey(colorkey)
+            pygame.draw.circle(sprite, pygame.Color(*color), (centre, centre), radius)
+            self._sprites[key] = (sprite, centre)
+        return self._sprites[key]
+
+    def draw_scene(self, screen, config, polygon_points, x, y, states, alpha, scale, offset_x, offset_y, show_radius):
+        screen.fill(config.background_color)
+
+        scaled_points = [(px * scale + offset_x, py * scale + offset_y) for px, py in polygon_points]
+        pygame.draw.polygon(screen, (255, 255, 255), scaled_points, 1)
+
+        scaled_x = (x * scale + offset_x).astype(int)
+        scaled_y = (y * scale + offset_y).astype(int)
+        colors = {
+            CellState.HEALTHY.value: config.color_healthy,
+            CellState.LATENT.value: config.color_latent,
+            CellState.ACTIVE.value: config.color_active,
+            CellState.DEAD.value: config.color_dead,
+        }
+        self.draw_cells(screen, scaled_x, scaled_y, states, colors, config.cell_size * scale)
+
+        if show_radius and alpha is not None:
+            self.draw_rings(screen, scaled_x, scaled_y, alpha, config.infection_radius * scale)
+
+    def draw_cells(self, screen, x, y, states, colors, radius):
+        # One blits() call per state instead of one draw call per cell
+        for state, color in colors.items():
+            selected = states == state
+            if not selected.any():
+                continue
+            sprite, centre = self._sprite(color, radius)
+            positions = np.column_stack((x[selected] - centre, y[selected] - centre)).tolist()
+            screen.blits([(sprite, position) for position in positions], doreturn=False)
+
+    def draw_rings(self, screen, x, y, alpha, radius):
+        highlighted = np.flatnonzero(alpha > 0)
+        if highlighted.size == 0:
+            return
+
+        size = screen.get_size()
+        if self._overlay is None or self._overlay.get_size() != size:
+            self._overlay = pygame.Surface(size, pygame.SRCALPHA)
+        self._overlay.fill((0, 0, 0, 0))
+        for i in highlighted:
+            pygame.draw.circle(self._overlay, (*self.RING_COLOR, int(alpha[i])), (int(x[i]), int(y[i])), radius, 1)
+        screen.blit(self._overlay, (0, 0))
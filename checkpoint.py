@@ -0,0 +1,50 @@
+import json
+import os
+
+import numpy as np
+
+from cell_automaton import CellAutomaton
+from config import Config
+from infection_log import InfectionLog
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, automaton: CellAutomaton, current_iteration, history=None):
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "config": automaton.config.to_dict(),
+        "rng": automaton.rng.bit_generator.state,
+        "current_iteration": int(current_iteration),
+        "current_day": int(automaton.current_day),
+        "daily_statistics": automaton.daily_statistics,
+    }
+    arrays = {f"cell_{name}": values for name, values in automaton.get_cell_arrays().items()}
+    arrays.update({f"log_{name}": values for name, values in automaton.infection_log.to_arrays().items()})
+    if history is not None:
+        arrays["history"] = np.asarray(history, dtype=np.int64)
+
+    # Write next to the target and swap it in, so a crash mid-save never leaves a truncated checkpoint behind
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta["version"] != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version: {meta['version']}")
+        cell_arrays = {key[len("cell_"):]: data[key] for key in data.files if key.startswith("cell_")}
+        log_arrays = {key[len("log_"):]: data[key] for key in data.files if key.startswith("log_")}
+        history = data["history"] if "history" in data.files else None
+
+    automaton = CellAutomaton(Config(**meta["config"]), cell_arrays=cell_arrays)
+    automaton.rng.bit_generator.state = meta["rng"]
+    automaton.restore_day(meta["current_day"])
+    automaton.daily_statistics = meta["daily_statistics"]
+    # Checkpoints from before the infection log start an empty one; estimates for their earlier days stay unknown
+    if log_arrays:
+        automaton.infection_log = InfectionLog.from_arrays(log_arrays)
+    return automaton, meta["current_iteration"], history
@@ -1,3 +1,11 @@
+import inspect
+
+from contagiousness import DEFAULT_CONTAGIOUSNESS, ContagiousnessTable
+
+# Cells per chunk of a memmap-backed population when chunk_size is not set
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
 class Config:
     def __init__(self, polygon_points=None, cell_count=1000, infected_count=1, latent_prob=0.25, iterations_per_day=26,
                  infection_probability=0.25, infection_radius=10, infection_period=225,
@@ -5,7 +13,10 @@ class Config:
                  cell_speed=0.5, death_probability=0.104, cell_size=3, infection_checks_per_iter=20, show_radius=True,
                  color_healthy=(127, 179, 213), color_latent=(203, 157, 240),
                  color_active=(255, 100, 100), color_dead=(0, 0, 0),
-                 background_color=(0, 0, 0)):
+                 background_color=(0, 0, 0), engine="auto",
+                 containment_resolution=None, seed=None, contagiousness=DEFAULT_CONTAGIOUSNESS, contact_level=1,
+                 parallel_workers=None, fast_forward=False, compact_storage=False, storage_directory=None,
+                 chunk_size=None):
         if not polygon_points:
             polygon_points = [(0, 0), (100, 0), (100, 100), (0, 100)]
         self.polygon_points = polygon_points
@@ -29,3 +40,45 @@ class Config:
         self.color_active = color_active
         self.color_dead = color_dead
         self.background_color = background_color
+        # "population" steps NumPy arrays, "numba" compiles the same steps, "reference" keeps the original list of
+        # Cell objects; "auto" uses "numba" when it is installed and the population is large enough to repay loading
+        # it, "population" otherwise; "parallel" splits the polygon into strips stepped by separate processes over
+        # shared memory
+        self.engine = engine
+        # Worker processes of the parallel engine; None uses every core
+        self.parallel_workers = parallel_workers
+        # Jump over stretches with no infectious cell instead of stepping them, see CellAutomaton.fast_forward
+        self.fast_forward = fast_forward
+        # float32 positions and velocities, uint8 states and int32 days: 26 bytes per cell instead of 51
+        self.compact_storage = compact_storage
+        # Directory for numpy.memmap files backing the cell arrays, for populations larger than memory
+        self.storage_directory = storage_directory
+        # Cells moved and scanned at a time; None steps all at once unless storage_directory is set
+        self.chunk_size = chunk_size
+        # Mask pixels per polygon unit for approximate containment tests; None uses the exact prepared polygon
+        self.containment_resolution = containment_resolution
+        # Seed for the automaton's numpy Generator; the same seed reproduces the same run exactly
+        self.seed = seed
+        # (peak day, rise days, decay days, peak probability) of the infectiousness curve
+        self.contagiousness = tuple(contagiousness)
+        self.contact_level = contact_level
+        self._contagiousness_table = None
+
+    def to_dict(self):
+        # Only constructor arguments, so Config(**config.to_dict()) round-trips
+        parameters = inspect.signature(Config.__init__).parameters
+        return {name: value for name, value in vars(self).items() if name in parameters}
+
+    def resolved_chunk_size(self):
+        if self.chunk_size:
+            return self.chunk_size
+        return DEFAULT_CHUNK_SIZE if self.storage_directory else None
+
+    def contagiousness_table(self):
+        # Cached, but rebuilt if the curve settings were edited after construction
+        table = self._contagiousness_table
+        if (table is None or table.contagiousness != tuple(self.contagiousness)
+                or table.contact_level != self.contact_level or len(table.table) <= self.infection_period):
+            table = ContagiousnessTable(self.contagiousness, self.contact_level, self.infection_period)
+            self._contagiousness_table = table
+        return table
@@ -0,0 +1,36 @@
+import numpy as np
+
+DEFAULT_CONTAGIOUSNESS = (150, 90, 50, 0.5)
+
+
+def contagiousness_curve(days, contagiousness=DEFAULT_CONTAGIOUSNESS, contact_level=1):
+    # (c, a, b, z): elliptic rise over the a days before peak day c, cubic-exponential decay of width b after it,
+    # scaled to peak probability z
+    days = np.asarray(days, dtype=np.float64)
+    c, a, b, z = contagiousness
+    l = contact_level if contact_level == 1 else contact_level * 0.2  # Модифікований рівень контакту
+
+    rising = (c - days) / a
+    falling = (days - c) / (b * (1 + (0.2 * (contact_level - 1))))
+    res = np.where(
+        days <= c,
+        np.sqrt(np.clip(1 - rising ** 2, 0, None)),
+        np.exp(-np.abs(falling) ** 3),
+    )
+    return res * z * l
+
+
+class ContagiousnessTable:
+    # Past the last tabulated day the curve has decayed to effectively zero, so lookups clamp to the last entry
+    TAIL_WIDTHS = 4
+
+    def __init__(self, contagiousness=DEFAULT_CONTAGIOUSNESS, contact_level=1, infection_period=0):
+        self.contagiousness = tuple(contagiousness)
+        self.contact_level = contact_level
+        c, a, b, z = self.contagiousness
+        last_day = max(int(infection_period), int(np.ceil(c + self.TAIL_WIDTHS * b)))
+        self.table = contagiousness_curve(np.arange(last_day + 1), self.contagiousness, contact_level)
+
+    def __call__(self, days):
+        days = np.clip(np.asarray(days, dtype=np.int64), 0, len(self.table) - 1)
+        return self.table[days]
@@ -0,0 +1,248 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from config import Config
+from infection_log import ESTIMATES
+from polygon import Polygon
+from simulate import (COLUMNS, CONFIG_OPTIONS, add_cache_arguments, add_config_arguments, build_options, open_cache,
+                      run_simulation, write_results)
+
+SWEEP_PARAMETERS = {
+    "infection_radius": float,
+    "death_probability": float,
+    "infection_prob_healthy": float,
+    "cell_count": int,
+    "polygon": str,
+}
+SWEEP_PARAMETERS.update({name: value_type for name, value_type in CONFIG_OPTIONS if name not in SWEEP_PARAMETERS})
+
+
+def expand_runs(base_options, sweep=None, replicates=1, base_seed=0):
+    sweep = sweep or {}
+    names = list(sweep)
+    scenarios = list(itertools.product(*(sweep[name] for name in names)))
+    seeds = np.random.SeedSequence(base_seed).spawn(len(scenarios) * replicates)
+
+    runs = []
+    for scenario_index, values in enumerate(scenarios):
+        parameters = dict(zip(names, values))
+        for replicate in range(replicates):
+            run_id = len(runs)
+            runs.append({
+                "run": run_id,
+                "scenario": scenario_index,
+                "replicate": replicate,
+                "seed": int(seeds[run_id].generate_state(1)[0]),
+                "parameters": parameters,
+                "options": _scenario_options(base_options, parameters),
+            })
+    return runs
+
+
+def _scenario_options(base_options, parameters):
+    options = dict(base_options)
+    options.pop("seed", None)
+    for name, value in parameters.items():
+        if name == "polygon":
+            options["polygon_points"], _ = Polygon.create_preset(value)
+        else:
+            options[name] = value
+    return options
+
+
+_publisher = None
+
+
+def _init_worker(sample_queue):
+    global _publisher
+    if sample_queue is None:
+        _publisher = None
+        return
+    from metrics import QueuePublisher
+    _publisher = QueuePublisher(sample_queue)
+
+
+def _run_one(options, seed, days, stop_when_no_infected, run_id=None, cache=None):
+    if _publisher is None:
+        return run_simulation(Config(**options, seed=seed), days, stop_when_no_infected=stop_when_no_infected,
+                              cache=cache)
+    try:
+        return run_simulation(Config(**options, seed=seed), days, stop_when_no_infected=stop_when_no_infected,
+                              publish=lambda sample: _publisher.publish(run_id, sample), cache=cache)
+    finally:
+        _publisher.flush()
+
+
+def iter_ensemble(runs, days, max_workers=None, stop_when_no_infected=False, max_retries=1, sample_queue=None,
+                  cache=None):
+    """Yield (run, results, error) for each run as soon as it finishes.
+
+    A worker crash breaks the whole pool; finished runs are already yielded,
+    and the unfinished ones are resubmitted to a fresh pool up to
+    max_retries times before being reported as failed. With a sample_queue,
+    workers put batches of per-day samples on it while they run. With a
+    ResultCache, runs already stored there are read back instead of stepped.
+    """
+    pending = {run["run"]: run for run in runs}
+    attempts = dict.fromkeys(pending, 0)
+    max_workers = max_workers or os.cpu_count()
+
+    while pending:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(sample_queue,)) as executor:
+                futures = {
+                    executor.submit(_run_one, run["options"], run["seed"], days, stop_when_no_infected, run_id,
+                                    cache): run_id
+                    for run_id, run in pending.items()
+                }
+                for future in as_completed(futures):
+                    run_id = futures[future]
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        yield pending.pop(run_id), None, e
+                    else:
+                        yield pending.pop(run_id), results, None
+        except BrokenProcessPool as e:
+            for run_id in list(pending):
+                attempts[run_id] += 1
+                if attempts[run_id] > max_retries:
+                    yield pending.pop(run_id), None, e
+
+
+def tidy_rows(run, results):
+    days = len(results["day"])
+    table = {
+        "run": np.full(days, run["run"]),
+        "scenario": np.full(days, run["scenario"]),
+        "replicate": np.full(days, run["replicate"]),
+        "seed": np.full(days, run["seed"], dtype=np.uint64),
+    }
+    for name, value in run["parameters"].items():
+        table[name] = np.full(days, value)
+    for column in COLUMNS + ESTIMATES:
+        table[column] = results[column]
+    return table
+
+
+def run_ensemble(runs, days, max_workers=None, stop_when_no_infected=False, on_result=None, sample_queue=None,
+                 cache=None):
+    tables = []
+    failures = []
+    for run, results, error in iter_ensemble(runs, days, max_workers, stop_when_no_infected,
+                                             sample_queue=sample_queue, cache=cache):
+        if error is not None:
+            failures.append((run, error))
+            continue
+        table = tidy_rows(run, results)
+        tables.append(table)
+        if on_result:
+            on_result(run, table)
+
+    tables.sort(key=lambda table: table["run"][0])
+    if not tables:
+        return {}, failures
+    return {column: np.concatenate([table[column] for table in tables]) for column in tables[0]}, failures
+
+
+def parse_sweep(values):
+    sweep = {}
+    for item in values or []:
+        name, _, choices = item.partition("=")
+        if name not in SWEEP_PARAMETERS or not choices:
+            raise ValueError(f"Invalid sweep: {item}")
+        sweep[name] = [SWEEP_PARAMETERS[name](choice) for choice in choices.split(",")]
+    return sweep
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run many seeded simulations in parallel.")
+    add_config_arguments(parser)
+    add_cache_arguments(parser)
+    parser.add_argument("--replicates", type=int, default=10, help="runs per scenario")
+    parser.add_argument("--sweep", action="append", metavar="NAME=V1,V2,...",
+                        help="parameter grid axis, e.g. infection_radius=5,10 or polygon=trench,office")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default="ensemble.csv", help="output file, .csv or .npz")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve per-day counts of every run, labelled by run id, on one endpoint (0: any port)")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="address the metrics endpoint listens on")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        # --seed is the base seed every per-run seed is derived from
+        runs = expand_runs(build_options(args), parse_sweep(args.sweep), args.replicates, args.seed or 0)
+        cache = open_cache(args)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    def report(run, table):
+        print(f"run {run['run'] + 1}/{len(runs)} finished", file=sys.stderr)
+
+    server = None
+    sample_queue = None
+    if args.metrics_port is not None:
+        from metrics import MetricsServer, forward_queue
+        try:
+            server = MetricsServer(args.metrics_host, args.metrics_port).start()
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(f"Serving metrics on {server.url}/metrics", file=sys.stderr)
+        # Workers batch samples onto the queue; one thread hands them to the server
+        sample_queue = multiprocessing.Queue()
+        stop_forwarding = threading.Event()
+        forwarder = threading.Thread(target=forward_queue, args=(sample_queue, server, stop_forwarding), daemon=True)
+        forwarder.start()
+
+    try:
+        if str(args.output).endswith(".npz"):
+            table, failures = run_ensemble(runs, args.days, args.workers, args.stop_when_no_infected,
+                                           on_result=report, sample_queue=sample_queue, cache=cache)
+            write_results(args.output, table)
+        else:
+            # Stream rows to disk as runs complete so a crash keeps everything already finished
+            failures = []
+            with open(args.output, "w", newline="") as f:
+                writer = None
+                for run, results, error in iter_ensemble(runs, args.days, args.workers, args.stop_when_no_infected,
+                                                         sample_queue=sample_queue, cache=cache):
+                    if error is not None:
+                        failures.append((run, error))
+                        continue
+                    table = tidy_rows(run, results)
+                    if writer is None:
+                        writer = csv.writer(f)
+                        writer.writerow(table.keys())
+                    writer.writerows(zip(*(column.tolist() for column in table.values())))
+                    f.flush()
+                    report(run, table)
+    finally:
+        if server:
+            stop_forwarding.set()
+            forwarder.join()
+            server.stop()
+
+    for run, error in failures:
+        print(f"run {run['run']} failed: {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import heapq
+
+import numpy as np
+
+
+class EventCalendar:
+    # Cell indices are bucketed by the day their event falls due; a heap of bucket days finds the earliest bucket
+    # without scanning. Entries are never removed early, so whoever pops them re-checks they are still current
+
+    def __init__(self):
+        self._buckets = {}
+        self._days = []
+
+    def __len__(self):
+        return sum(chunk.size for chunks in self._buckets.values() for chunk in chunks)
+
+    def clear(self):
+        self._buckets.clear()
+        self._days.clear()
+
+    def schedule(self, days, indices):
+        days = np.asarray(days, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.intp)
+        if indices.size == 0:
+            return
+        order = np.argsort(days, kind="stable")
+        days, indices = days[order], indices[order]
+        bucket_days, starts = np.unique(days, return_index=True)
+        for day, chunk in zip(bucket_days.tolist(), np.split(indices, starts[1:])):
+            bucket = self._buckets.get(day)
+            if bucket is None:
+                self._buckets[day] = [chunk]
+                heapq.heappush(self._days, day)
+            else:
+                bucket.append(chunk)
+
+    def next_day(self):
+        return self._days[0] if self._days else None
+
+    def pop_due(self, day):
+        chunks = []
+        while self._days and self._days[0] <= day:
+            chunks.extend(self._buckets.pop(heapq.heappop(self._days)))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.intp)
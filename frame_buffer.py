@@ -0,0 +1,43 @@
+import math
+import sys
+
+import numpy as np
+import pygame
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+
+# QImage.Format_RGB32 stores native-endian 0xffRRGGBB words
+PIXEL_FORMAT = "BGRA" if sys.byteorder == "little" else "ARGB"
+
+
+class FrameBuffer:
+    GROWTH_FACTOR = 1.5
+
+    def __init__(self, width, height):
+        self._pixels = None
+        self._canvas = None
+        self.surface = None
+        self.image = None
+        self.resize(width, height)
+
+    @property
+    def size(self):
+        return self.surface.get_size()
+
+    def resize(self, width, height):
+        width, height = max(1, int(width)), max(1, int(height))
+        if self.surface is not None and self.size == (width, height):
+            return
+
+        capacity_height, capacity_width = self._pixels.shape[:2] if self._pixels is not None else (0, 0)
+        if width > capacity_width or height > capacity_height:
+            # Grow geometrically so dragging a window edge does not reallocate on every resize event
+            capacity_width = max(width, math.ceil(capacity_width * self.GROWTH_FACTOR))
+            capacity_height = max(height, math.ceil(capacity_height * self.GROWTH_FACTOR))
+            self._pixels = np.zeros((capacity_height, capacity_width, 4), dtype=np.uint8)
+            self._canvas = pygame.image.frombuffer(self._pixels.reshape(-1), (capacity_width, capacity_height), PIXEL_FORMAT)
+
+        # pygame draws into a view of the shared pixels and the QImage reads the same memory, so nothing is copied per frame
+        self.surface = self._canvas.subsurface((0, 0, width, height))
+        bytes_per_line = self._pixels.shape[1] * 4
+        self.image = QImage(sip.voidptr(self._pixels.ctypes.data), width, height, bytes_per_line, QImage.Format_RGB32)
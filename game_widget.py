@@ -1,88 +1,208 @@
 import pygame
-from PyQt5.QtWidgets import QWidget
+from PyQt5.QtWidgets import QApplication, QWidget, QSizePolicy
 from PyQt5.QtCore import QTimer, pyqtSignal
-from PyQt5.QtGui import QPainter, QImage
-from cell_automaton import CellAutomaton
+from PyQt5.QtGui import QPainter
 from config import Config
+from cell_renderer import CellRenderer
+from frame_buffer import FrameBuffer
+from simulation_worker import SimulationWorker
+from trajectory import TrajectoryReader
 
 
 class GameWidget(QWidget):
-    statistics_updated = pyqtSignal(int, int, int, int, int)
+    statistics_updated = pyqtSignal(int, int, int, int, int, float, float)
+    replay_position_changed = pyqtSignal(int)
+    FRAME_INTERVAL_MS = 16
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.config = None
-        self.setFixedSize(600, 400)
+        self.setMinimumSize(600, 400)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self._initialize_pygame()
         self.cell_automaton = None
-        self.is_paused = False
-        self.auto_stop_enabled = True
+        self.worker = SimulationWorker(self)
+        self.worker.start()
+        QApplication.instance().aboutToQuit.connect(self.worker.stop)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.game_loop)
-        self.timer.start(16)
-        self.current_iteration = 0
-        self.current_day = 0
-        self.auto_stop_triggered = False
+        self.timer.start(self.FRAME_INTERVAL_MS)
         self.scale = 1.0
         self.offset_x = 0
         self.offset_y = 0
         self.polygon_points = []
+        self.replay = None
+        self.replay_config = None
+        self.replay_position = 0.0
+        self.replay_speed = 1.0
+        self.replay_renderer = CellRenderer()
+        self._live_polygon_points = []
 
     def _initialize_pygame(self):
         pygame.init()
-        self.screen = pygame.Surface((600, 400))
+        self.frame_buffer = FrameBuffer(600, 400)
+
+    @property
+    def screen(self):
+        return self.frame_buffer.surface
+
+    @property
+    def profiler(self):
+        return self.worker.profiler
+
+    @property
+    def is_paused(self):
+        return self.worker.is_paused
+
+    @property
+    def current_day(self):
+        return self.worker.current_day
 
     def toggle_pause(self):
-        self.is_paused = not self.is_paused
+        self.worker.set_paused(not self.worker.is_paused)
 
     def toggle_auto_stop(self):
-        self.auto_stop_enabled = not self.auto_stop_enabled
+        self.worker.auto_stop_enabled = not self.worker.auto_stop_enabled
+
+    def set_steps_per_frame(self, steps_per_frame):
+        self.worker.set_steps_per_frame(steps_per_frame)
+
+    def set_turbo(self, turbo):
+        self.worker.set_turbo(turbo)
+
+    def set_profiling(self, enabled):
+        self.worker.set_profiling(enabled)
+
+    def set_metrics_port(self, port):
+        # None stops publishing; raises OSError if the port cannot be bound
+        server = None
+        if port is not None:
+            from metrics import MetricsServer
+            server = MetricsServer(port=port).start()
+        self.worker.set_metrics(server)
+        return server
 
     def set_radius_visible(self, show_radius):
         if self.cell_automaton:
             self.cell_automaton.show_radius = show_radius
 
-    def start_simulation(self, config: Config):
-        self.cell_automaton = CellAutomaton(config)
+    def start_simulation(self, config: Config, result_cache=None, days=None):
+        self.stop_replay()
+        self.cell_automaton = self.worker.start_simulation(config, result_cache, days)
         self.cell_automaton.offset_x = self.offset_x
         self.cell_automaton.offset_y = self.offset_y
         self.cell_automaton.scale = self.scale
-        self.current_day = 0
         self.config = config
-        self.is_paused = False
 
-        self.auto_stop_triggered = False
-        self.current_iteration = 0
+    def stop_simulation(self):
+        self.stop_replay()
+        self.worker.stop_simulation()
+        self.cell_automaton = None
+        self.config = None
+        self.update_pygame_screen()
+        self.update()
 
-    def game_loop(self):
-        if self.cell_automaton and not self.is_paused:
-            self.current_iteration += 1
+    def save_checkpoint(self, path):
+        self.worker.save_checkpoint(path)
 
-            # Update the current day based on iterations_per_day
-            if self.current_iteration % self.config.iterations_per_day == 0:
-                self.current_day += 1
+    def load_checkpoint(self, path):
+        self.stop_replay()
+        self.cell_automaton = self.worker.load_checkpoint(path)
+        self.cell_automaton.offset_x = self.offset_x
+        self.cell_automaton.offset_y = self.offset_y
+        self.cell_automaton.scale = self.scale
+        self.config = self.cell_automaton.config
+        self.update()
+        return self.worker.history
+
+    def set_auto_checkpoint(self, path):
+        self.worker.auto_checkpoint_path = path
+
+    def set_recording(self, directory):
+        self.worker.set_record_directory(directory)
+
+    def start_replay(self, directory):
+        replay = TrajectoryReader(directory)
+        if len(replay) == 0:
+            raise ValueError("The recording contains no frames.")
+        self.worker.set_paused(True)
+        self.replay = replay
+        self.replay_config = Config(**replay.config)
+        self.replay_position = 0.0
+        self._live_polygon_points = self.polygon_points
+        self.polygon_points = self.replay_config.polygon_points
+        self._update_offsets()
+        return len(replay)
+
+    def stop_replay(self):
+        if self.replay is None:
+            return
+        self.replay = None
+        self.polygon_points = self._live_polygon_points
+        self._update_offsets()
+        if self.cell_automaton:
+            self._draw_live_frame()
+        else:
+            self.update_pygame_screen()
+        self.update()
 
-            self.cell_automaton.update(self.current_iteration, self.current_day)
-            self.cell_automaton.draw(self.screen)
+    def seek_replay(self, frame):
+        if self.replay is not None:
+            self.replay_position = float(min(max(frame, 0), len(self.replay) - 1))
 
-            self.update_statistics()
+    def set_replay_speed(self, frames_per_tick):
+        self.replay_speed = frames_per_tick
 
+    def _draw_replay_frame(self):
+        _, _, x, y, states = self.replay.frame(int(self.replay_position))
+        self.replay_renderer.draw_scene(self.screen, self.replay_config, self.polygon_points, x, y, states, None,
+                                        self.scale, self.offset_x, self.offset_y, False)
+
+    def _replay_loop(self):
+        # Frames come straight from the recording; the model is never stepped
+        if self.isVisible():
+            self._draw_replay_frame()
             self.repaint()
+        self.replay_position_changed.emit(int(self.replay_position))
+        self.replay_position = min(self.replay_position + self.replay_speed, len(self.replay) - 1)
 
-            if self.auto_stop_enabled and not self.auto_stop_triggered:
-                if self.cell_automaton.no_infected():
-                    self.toggle_pause()
-                    self.auto_stop_triggered = True
+    def game_loop(self):
+        if self.replay is not None:
+            self._replay_loop()
+            return
+
+        # The model steps on the worker thread; each frame only copies the latest state and flushes finished days
+        # under its lock, and renders the copy after releasing it
+        snapshot = None
+        self.worker.begin_frame()
+        try:
+            if self.cell_automaton and self.isVisible():
+                snapshot = self.cell_automaton.snapshot()
+            statistics = self.worker.take_statistics()
+        finally:
+            self.worker.end_frame()
+
+        if snapshot is not None:
+            self.cell_automaton.draw_snapshot(self.screen, snapshot)
+        for row in statistics:
+            self.statistics_updated.emit(*row)
+
+        if self.cell_automaton and self.isVisible():
+            self.repaint()
 
-    def update_statistics(self):
-        if self.cell_automaton:
-            healthy, infected, latent, dead = self.cell_automaton.get_statistics()
-            self.statistics_updated.emit(self.current_day, healthy, latent, infected, dead)
+    def _draw_live_frame(self):
+        snapshot = self.worker.snapshot()
+        if snapshot is not None:
+            self.cell_automaton.draw_snapshot(self.screen, snapshot)
 
     def set_polygon(self, polygon_points, scale):
         self.polygon_points = polygon_points
         self.scale = scale
+        self._update_offsets()
+        self.update_pygame_screen()
+        self.update()
 
+    def _update_offsets(self):
         if self.polygon_points:
             min_x = min(point[0] for point in self.polygon_points)
             max_x = max(point[0] for point in self.polygon_points)
@@ -94,8 +214,21 @@ class GameWidget(QWidget):
 
             self.offset_x = (self.width() - polygon_width * self.scale) / 2 - min_x * self.scale
             self.offset_y = (self.height() - polygon_height * self.scale) / 2 - min_y * self.scale
-        self.update_pygame_screen()
-        self.update()
+
+        if self.cell_automaton:
+            self.cell_automaton.offset_x = self.offset_x
+            self.cell_automaton.offset_y = self.offset_y
+
+    def resizeEvent(self, event):
+        self.frame_buffer.resize(self.width(), self.height())
+        self._update_offsets()
+        if self.replay is not None:
+            self._draw_replay_frame()
+        elif self.cell_automaton:
+            self._draw_live_frame()
+        else:
+            self.update_pygame_screen()
+        super().resizeEvent(event)
 
     def update_pygame_screen(self):
         self.screen.fill((0, 0, 0))
@@ -110,8 +243,7 @@ class GameWidget(QWidget):
             pygame.draw.polygon(self.screen, (255, 255, 255), scaled_points, 1)
 
     def paintEvent(self, event):
-        painter = QPainter(self)
-        if self.screen:
-            image = pygame.image.tostring(self.screen, 'RGB')
-            qt_image = QImage(image, 600, 400, QImage.Format_RGB888)
-            painter.drawImage(0, 0, qt_image)
+        with self.profiler.measure("paint"):
+            painter = QPainter(self)
+            painter.drawImage(0, 0, self.frame_buffer.image)
+            painter.end()
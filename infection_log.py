@@ -0,0 +1,160 @@
+import math
+
+import numpy as np
+
+# 29 bytes per event; cell ids and days fit in 31 bits at any population this model can hold
+COLUMNS = {
+    "day": np.int32, "iteration": np.int64, "infector": np.int32, "infectee": np.int32, "prior_state": np.uint8,
+    "contagiousness": np.float32, "infector_age": np.int32,
+}
+
+ESTIMATES = ("r_t", "generation_interval")
+
+
+class InfectionLog:
+    # Append-only columns of successful infections, filled in fixed-size chunks so an append never copies earlier
+    # events. Per-day transmission counts, infector ages and onsets (cells turning ACTIVE, whether infected, seeded or
+    # reactivated) are kept alongside, so closing a day updates R_t and the generation interval in O(infectious
+    # period) instead of rescanning the log:
+    #   w_k    weights[k], the model's share of an infector's transmissions made k days after it turned ACTIVE
+    #   L_t    infectious pressure, sum over k of onsets on day t - k times w_k
+    #   R_t    transmissions over the last `window` days divided by their pressure
+    # The weights come from the contagiousness curve rather than from the ages logged so far: those are cut off at
+    # the oldest infection seen yet, which early on puts all the weight on young ages and inflates R_t
+    CHUNK_EVENTS = 1 << 16
+
+    def __init__(self, weights, window=7, chunk_events=CHUNK_EVENTS):
+        if window < 1:
+            raise ValueError("The estimate window must be at least one day.")
+        weights = np.asarray(weights, dtype=np.float64)
+        # Kept as given, so a log rebuilt from its arrays normalises the same values and matches to the last digit
+        self.raw_weights = weights
+        if weights.size == 0:
+            raise ValueError("Generation-interval weights need at least one day.")
+        if weights.sum() <= 0:
+            # A curve that stays at zero over the whole infectious period (e.g. a short period under the default
+            # curve) says nothing about timing; count every day of it alike
+            weights = np.ones_like(weights)
+        self.weights = weights / weights.sum()
+        self.window = window
+        self.chunk_events = chunk_events
+        self._chunks = []
+        self._size = 0
+        # Events appended since the last closed day
+        self._open_count = 0
+        self._open_age_sum = 0
+        # One entry per closed day
+        self.onsets = []
+        self.transmissions = []
+        self.age_sums = []
+        self.pressure = []
+        self.r_t = []
+        self.generation_interval = []
+
+    def __len__(self):
+        return self._size
+
+    def append(self, day, iteration, infectors, infectees, prior_states, contagiousness, infector_ages):
+        infectors = np.asarray(infectors)
+        count = infectors.size
+        if count == 0:
+            return
+        values = {"day": day, "iteration": iteration, "infector": infectors, "infectee": infectees,
+                  "prior_state": prior_states, "contagiousness": contagiousness, "infector_age": infector_ages}
+        written = 0
+        while written < count:
+            if not self._chunks or self._size % self.chunk_events == 0:
+                self._chunks.append({name: np.empty(self.chunk_events, dtype=dtype) for name, dtype in COLUMNS.items()})
+            start = self._size % self.chunk_events
+            take = min(count - written, self.chunk_events - start)
+            for name, value in values.items():
+                value = np.asarray(value)
+                self._chunks[-1][name][start:start + take] = value if value.ndim == 0 else value[written:written + take]
+            written += take
+            self._size += take
+
+        self._open_count += count
+        self._open_age_sum += int(np.asarray(infector_ages, dtype=np.int64).sum())
+
+    def close_day(self, day, onsets):
+        # Closing a day twice (e.g. the GUI's first sample at day 0) folds the second call into it; skipped days are
+        # closed with no onsets
+        while len(self.onsets) <= day:
+            for series in (self.onsets, self.transmissions, self.age_sums, self.pressure):
+                series.append(0)
+            self.r_t.append(math.nan)
+            self.generation_interval.append(math.nan)
+            if len(self.onsets) <= day:
+                self._estimate(len(self.onsets) - 1)
+        self.onsets[day] += int(onsets)
+        self.transmissions[day] += self._open_count
+        self.age_sums[day] += self._open_age_sum
+        self._open_count = self._open_age_sum = 0
+        self._estimate(day)
+        return self.r_t[day], self.generation_interval[day]
+
+    def _estimate(self, day):
+        weights = self.weights[:day + 1]
+        # onsets[day], onsets[day - 1], ... paired with w_0, w_1, ...
+        recent = np.asarray(self.onsets[day - weights.size + 1:day + 1][::-1], dtype=np.float64)
+        self.pressure[day] = float(recent @ weights)
+        first = max(0, day - self.window + 1)
+        pressure = sum(self.pressure[first:day + 1])
+        transmissions = sum(self.transmissions[first:day + 1])
+        self.r_t[day] = transmissions / pressure if pressure > 0 else math.nan
+        self.generation_interval[day] = (sum(self.age_sums[first:day + 1]) / transmissions if transmissions
+                                         else math.nan)
+
+    def estimates(self, days):
+        # R_t and generation interval on the given days, NaN where a day was never closed
+        days = np.asarray(days, dtype=np.intp)
+        known = days < len(self.r_t)
+        result = {}
+        for name in ESTIMATES:
+            values = np.full(days.size, np.nan)
+            values[known] = np.asarray(getattr(self, name), dtype=np.float64)[days[known]]
+            result[name] = values
+        return result
+
+    def chunks(self):
+        # Filled part of every chunk, oldest first, without copying
+        for index, chunk in enumerate(self._chunks):
+            filled = min(self.chunk_events, self._size - index * self.chunk_events)
+            yield {name: values[:filled] for name, values in chunk.items()}
+
+    def columns(self):
+        chunks = list(self.chunks())
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.empty(0, dtype=dtype)
+                for name, dtype in COLUMNS.items()}
+
+    def to_arrays(self):
+        arrays = self.columns()
+        arrays["day_counts"] = np.array([self.onsets, self.transmissions, self.age_sums], dtype=np.int64)
+        arrays["window"] = np.array(self.window)
+        arrays["weights"] = self.raw_weights
+        return arrays
+
+    def save(self, path):
+        np.savez(path, **self.to_arrays())
+
+    @classmethod
+    def from_arrays(cls, arrays, chunk_events=CHUNK_EVENTS):
+        log = cls(arrays["weights"], int(arrays["window"]), chunk_events=chunk_events)
+        # In the order append takes them
+        events = {name: arrays[name] for name in COLUMNS}
+        # Replayed day by day to rebuild the per-day series the estimates roll over
+        onsets, transmissions, _ = arrays["day_counts"]
+        start = 0
+        for day in range(len(onsets)):
+            stop = start + int(transmissions[day])
+            log.append(*(values[start:stop] for values in events.values()))
+            log.close_day(day, onsets[day])
+            start = stop
+        # Events of the day still open when the arrays were taken
+        log.append(*(values[start:] for values in events.values()))
+        return log
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls.from_arrays({name: data[name] for name in data.files})
@@ -1,11 +1,18 @@
-from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QGridLayout, QWidget, QLineEdit, QLabel, QPushButton, QCheckBox, QSpacerItem, QSizePolicy, QScrollArea, QGroupBox, QFormLayout, QMessageBox, QComboBox
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QGridLayout, QWidget, QLineEdit, QLabel, QPushButton, QCheckBox, QSpacerItem, QSizePolicy, QScrollArea, QGroupBox, QFormLayout, QMessageBox, QComboBox, QSpinBox, QFileDialog, QSlider, QDoubleSpinBox
+from PyQt5.QtCore import Qt
 from game_widget import GameWidget
+from profiler_widget import ProfilerWidget
 from statistics_widget import StatisticsWidget
 from config import Config
 from polygon import Polygon
+from scenario import APPEARANCE, load_scenario, save_scenario, scenario_key
 
 
 class MainWindow(QMainWindow):
+    AUTO_CHECKPOINT_PATH = "autosave_checkpoint.npz"
+    TRAJECTORY_DIRECTORY = "trajectory"
+    METRICS_PORT = 9108
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Cellular Automaton - Infection Simulation")
@@ -14,6 +21,8 @@ class MainWindow(QMainWindow):
 
         self.config = Config()
         self.polygon = Polygon()
+        self.scenario_days = None
+        self.result_cache = None
 
         main_widget = QWidget()
         main_widget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
@@ -90,6 +99,38 @@ class MainWindow(QMainWindow):
         show_hide_checkbox.stateChanged.connect(self.toggle_animation_visibility)
         controls_layout.addWidget(show_hide_checkbox)
 
+        speed_layout = QFormLayout()
+        self.steps_per_frame_input = QSpinBox()
+        self.steps_per_frame_input.setRange(1, 10000)
+        self.steps_per_frame_input.setValue(1)
+        self.steps_per_frame_input.valueChanged.connect(self.set_steps_per_frame)
+        speed_layout.addRow(QLabel("Steps per Frame"), self.steps_per_frame_input)
+        controls_layout.addLayout(speed_layout)
+
+        turbo_checkbox = QCheckBox("Turbo (step as fast as possible)")
+        turbo_checkbox.setChecked(False)
+        turbo_checkbox.stateChanged.connect(self.set_turbo)
+        controls_layout.addWidget(turbo_checkbox)
+
+        self.fast_forward_checkbox = QCheckBox("Fast-forward when nobody is infectious")
+        self.fast_forward_checkbox.setChecked(self.config.fast_forward)
+        self.fast_forward_checkbox.stateChanged.connect(self.set_fast_forward)
+        controls_layout.addWidget(self.fast_forward_checkbox)
+
+        self.metrics_checkbox = QCheckBox(f"Serve metrics on localhost:{self.METRICS_PORT}")
+        self.metrics_checkbox.setChecked(False)
+        self.metrics_checkbox.stateChanged.connect(self.set_metrics)
+        controls_layout.addWidget(self.metrics_checkbox)
+
+        self.use_cache_checkbox = QCheckBox("Show cached results of seeded scenarios")
+        self.use_cache_checkbox.setChecked(True)
+        controls_layout.addWidget(self.use_cache_checkbox)
+
+        auto_checkpoint_checkbox = QCheckBox("Auto-checkpoint (every 10 days)")
+        auto_checkpoint_checkbox.setChecked(False)
+        auto_checkpoint_checkbox.stateChanged.connect(self.set_auto_checkpoint)
+        controls_layout.addWidget(auto_checkpoint_checkbox)
+
         # Group 5: Polygon Type
         polygon_group = QGroupBox("Polygon Type")
         polygon_layout = QFormLayout()
@@ -120,6 +161,53 @@ class MainWindow(QMainWindow):
         save_button.clicked.connect(self.save_plot)
         controls_layout.addWidget(save_button)
 
+        save_checkpoint_button = QPushButton("Save Checkpoint")
+        save_checkpoint_button.setFixedHeight(button_height)
+        save_checkpoint_button.clicked.connect(self.save_checkpoint)
+        controls_layout.addWidget(save_checkpoint_button)
+
+        load_checkpoint_button = QPushButton("Load Checkpoint")
+        load_checkpoint_button.setFixedHeight(button_height)
+        load_checkpoint_button.clicked.connect(self.load_checkpoint)
+        controls_layout.addWidget(load_checkpoint_button)
+
+        load_scenario_button = QPushButton("Load Scenario")
+        load_scenario_button.setFixedHeight(button_height)
+        load_scenario_button.clicked.connect(self.load_scenario)
+        controls_layout.addWidget(load_scenario_button)
+
+        save_scenario_button = QPushButton("Save Scenario")
+        save_scenario_button.setFixedHeight(button_height)
+        save_scenario_button.clicked.connect(self.save_scenario)
+        controls_layout.addWidget(save_scenario_button)
+
+        # Group 6: Recording and Replay
+        replay_group = QGroupBox("Recording and Replay")
+        replay_layout = QFormLayout()
+        record_checkbox = QCheckBox("Record Trajectory")
+        record_checkbox.setChecked(False)
+        record_checkbox.stateChanged.connect(self.set_recording)
+        replay_layout.addRow(record_checkbox)
+
+        load_replay_button = QPushButton("Load Replay")
+        load_replay_button.clicked.connect(self.load_replay)
+        exit_replay_button = QPushButton("Exit Replay")
+        exit_replay_button.clicked.connect(self.exit_replay)
+        replay_layout.addRow(load_replay_button, exit_replay_button)
+
+        self.replay_slider = QSlider(Qt.Horizontal)
+        self.replay_slider.setEnabled(False)
+        self.replay_slider.sliderMoved.connect(self.seek_replay)
+        replay_layout.addRow(QLabel("Frame"), self.replay_slider)
+
+        self.replay_speed_input = QDoubleSpinBox()
+        self.replay_speed_input.setRange(0.1, 1000)
+        self.replay_speed_input.setValue(1.0)
+        self.replay_speed_input.valueChanged.connect(self.set_replay_speed)
+        replay_layout.addRow(QLabel("Frames per Tick"), self.replay_speed_input)
+        replay_group.setLayout(replay_layout)
+        param_layout.addWidget(replay_group)
+
         controls_layout.addSpacerItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
         controls_group.setLayout(controls_layout)
         param_layout.addWidget(controls_group)
@@ -133,6 +221,10 @@ class MainWindow(QMainWindow):
         self.game_widget = GameWidget(self)
         layout.addWidget(self.game_widget, 0, 1)
 
+        # Group 7: Profiling
+        self.profiler_widget = ProfilerWidget(self.game_widget)
+        param_layout.addWidget(self.profiler_widget)
+
         self.polygon_type_combo.setCurrentText("Open Area")
         self.create_polygon()
 
@@ -145,7 +237,9 @@ class MainWindow(QMainWindow):
         main_widget.setLayout(layout)
         self.setCentralWidget(main_widget)
 
+        self.plot_widget.profiler = self.game_widget.profiler
         self.game_widget.statistics_updated.connect(self.plot_widget.add_data)
+        self.game_widget.replay_position_changed.connect(self.update_replay_slider)
 
     def create_polygon(self):
         try:
@@ -162,32 +256,117 @@ class MainWindow(QMainWindow):
         except ValueError as e:
             QMessageBox.critical(self, "Error", str(e))
 
+    def scenario_inputs(self):
+        return {
+            "cell_count": self.cell_count_input,
+            "infected_count": self.infected_count_input,
+            "latent_prob": self.latent_prob_input,
+            "iterations_per_day": self.cycles_per_day_input,
+            "infection_checks_per_iter": self.infection_checks_per_iter_input,
+            "latent_to_active_prob": self.latent_to_active_probability_input,
+            "infection_prob_latent": self.infection_probability_latent_input,
+            "infection_prob_healthy": self.infection_probability_active_input,
+            "death_probability": self.death_probability_input,
+            "cell_speed": self.cell_speed_input,
+            "cell_size": self.cell_size_input,
+            "infection_radius": self.infection_radius_input,
+        }
+
+    def read_config(self):
+        if not self.polygon.current_polygon:
+            raise ValueError("Polygon not selected. Please select a polygon for the simulation.")
+
+        # A fresh Config per run: the running automaton and its worker keep reading theirs until the new one is
+        # swapped in
+        config = Config(**self.config.to_dict())
+        config.polygon_points = self.polygon.current_polygon
+        config.cell_count = int(self.cell_count_input.text())
+        config.infected_count = int(self.infected_count_input.text())
+        config.latent_prob = float(self.latent_prob_input.text())
+        config.iterations_per_day = int(self.cycles_per_day_input.text())
+        config.infection_checks_per_iter = int(
+            self.infection_checks_per_iter_input.text())  # Read from new location
+        # config.infection_probability = float(self.infection_probability_input.text())
+        config.infection_radius = float(self.infection_radius_input.text())
+        # config.infection_period = int(self.infection_period_input.text())
+        config.latent_to_active_prob = float(self.latent_to_active_probability_input.text())
+        config.infection_prob_latent = float(self.infection_probability_latent_input.text())
+        config.infection_prob_healthy = float(self.infection_probability_active_input.text())
+        config.cell_speed = float(self.cell_speed_input.text())
+        config.death_probability = float(self.death_probability_input.text())
+        config.cell_size = float(self.cell_size_input.text())
+        return config
+
+    def result_cache_for(self, config):
+        # Only a seeded scenario with a run length names a single, reproducible result
+        if not self.use_cache_checkbox.isChecked() or self.scenario_days is None or config.seed is None:
+            return None
+        if self.result_cache is None:
+            from result_cache import ResultCache
+            self.result_cache = ResultCache()
+        return self.result_cache
+
+    def cached_result(self, config):
+        cache = self.result_cache_for(config)
+        if cache is None:
+            return None
+        # Keyed as simulate.py keys a run without --stop-when-no-infected: auto-stop only pauses a GUI run, and only
+        # runs that reach scenario_days are stored
+        return cache.get(scenario_key(config, self.scenario_days))
+
     def start_simulation(self):
         try:
-            if not self.polygon.current_polygon:
-                raise ValueError("Polygon not selected. Please select a polygon for the simulation.")
-
-            self.config.polygon_points = self.polygon.current_polygon
-            self.config.cell_count = int(self.cell_count_input.text())
-            self.config.infected_count = int(self.infected_count_input.text())
-            self.config.latent_prob = float(self.latent_prob_input.text())
-            self.config.iterations_per_day = int(self.cycles_per_day_input.text())
-            self.config.infection_checks_per_iter = int(
-                self.infection_checks_per_iter_input.text())  # Read from new location
-            # self.config.infection_probability = float(self.infection_probability_input.text())
-            self.config.infection_radius = int(self.infection_radius_input.text())
-            # self.config.infection_period = int(self.infection_period_input.text())
-            self.config.latent_to_active_prob = float(self.latent_to_active_probability_input.text())
-            self.config.infection_prob_latent = float(self.infection_probability_latent_input.text())
-            self.config.infection_prob_active = float(self.infection_probability_active_input.text())
-            self.config.cell_speed = float(self.cell_speed_input.text())
-            self.config.death_probability = float(self.death_probability_input.text())
-            self.config.cell_size = float(self.cell_size_input.text())
-
-            self.game_widget.start_simulation(self.config)
+            config = self.read_config()
+            cached = self.cached_result(config)
+            if cached is not None:
+                # The running simulation would keep feeding its own days into the plot
+                self.game_widget.stop_simulation()
+                self.plot_widget.reset_data()
+                columns = ("day", "healthy", "latent", "active", "dead", "r_t", "generation_interval")
+                for row in zip(*(cached[column].tolist() for column in columns)):
+                    self.plot_widget.add_data(*row)
+                self.statusBar().showMessage(f"Showing the cached result of {self.scenario_days} days", 5000)
+                return
+
+            self.game_widget.start_simulation(config, self.result_cache_for(config), self.scenario_days)
             self.plot_widget.reset_data()
             self.set_radius_visibility()
-        except ValueError as e:
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", str(e))
+
+    def load_scenario(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Scenario", "", "Scenarios (*.json *.toml)")
+        if not path:
+            return
+        try:
+            options = load_scenario(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+
+        self.scenario_days = options.pop("days", None)
+        # Settings the scenario leaves out go back to their defaults; colours stay as they are
+        for name, value in Config(**options).to_dict().items():
+            if name not in APPEARANCE:
+                setattr(self.config, name, value)
+        self.fast_forward_checkbox.setChecked(self.config.fast_forward)
+        for name, line_edit in self.scenario_inputs().items():
+            line_edit.setText(str(getattr(self.config, name)))
+        points = self.config.polygon_points
+        width = max(x for x, _ in points) - min(x for x, _ in points)
+        height = max(y for _, y in points) - min(y for _, y in points)
+        # Fit the polygon into the default 600x400 view, as the presets' scales do
+        self.scale = min(600 / max(width, 1e-9), 400 / max(height, 1e-9))
+        self.polygon.current_polygon = points
+        self.game_widget.set_polygon(points, self.scale)
+
+    def save_scenario(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Scenario", "scenario.json", "Scenarios (*.json)")
+        if not path:
+            return
+        try:
+            save_scenario(path, self.read_config(), self.scenario_days)
+        except (OSError, ValueError) as e:
             QMessageBox.critical(self, "Error", str(e))
 
     def pause_simulation(self):
@@ -199,6 +378,83 @@ class MainWindow(QMainWindow):
     def save_plot(self):
         self.plot_widget.save_plot()
 
+    def set_steps_per_frame(self, steps_per_frame):
+        self.game_widget.set_steps_per_frame(steps_per_frame)
+
+    def set_turbo(self, state):
+        self.game_widget.set_turbo(bool(state))
+
+    def set_fast_forward(self, state):
+        # The worker reads this flag from the shared Config every day, so it applies to a running simulation too
+        self.config.fast_forward = bool(state)
+        if self.game_widget.config is not None:
+            self.game_widget.config.fast_forward = bool(state)
+
+    def set_metrics(self, state):
+        try:
+            self.game_widget.set_metrics_port(self.METRICS_PORT if state else None)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", str(e))
+            self.metrics_checkbox.setChecked(False)
+
+    def save_checkpoint(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Checkpoint", "checkpoint.npz", "Checkpoints (*.npz)")
+        if not path:
+            return
+        try:
+            self.game_widget.save_checkpoint(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", str(e))
+
+    def load_checkpoint(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Checkpoint", "", "Checkpoints (*.npz)")
+        if not path:
+            return
+        try:
+            history = self.game_widget.load_checkpoint(path)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+
+        self.plot_widget.reset_data()
+        estimates = self.game_widget.cell_automaton.infection_log.estimates([row[0] for row in history])
+        for row, r_t, generation_interval in zip(history, estimates["r_t"].tolist(),
+                                                 estimates["generation_interval"].tolist()):
+            self.plot_widget.add_data(*row, r_t, generation_interval)
+        self.set_radius_visibility()
+
+    def set_auto_checkpoint(self, state):
+        self.game_widget.set_auto_checkpoint(self.AUTO_CHECKPOINT_PATH if state else None)
+
+    def set_recording(self, state):
+        self.game_widget.set_recording(self.TRAJECTORY_DIRECTORY if state else None)
+
+    def load_replay(self):
+        directory = QFileDialog.getExistingDirectory(self, "Load Replay", self.TRAJECTORY_DIRECTORY)
+        if not directory:
+            return
+        try:
+            frame_count = self.game_widget.start_replay(directory)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        self.replay_slider.setRange(0, frame_count - 1)
+        self.replay_slider.setEnabled(True)
+
+    def exit_replay(self):
+        self.game_widget.stop_replay()
+        self.replay_slider.setEnabled(False)
+
+    def seek_replay(self, frame):
+        self.game_widget.seek_replay(frame)
+
+    def set_replay_speed(self, frames_per_tick):
+        self.game_widget.set_replay_speed(frames_per_tick)
+
+    def update_replay_slider(self, frame):
+        if not self.replay_slider.isSliderDown():
+            self.replay_slider.setValue(frame)
+
     def toggle_animation_visibility(self):
         self.game_widget.setVisible(not self.game_widget.isVisible())
 
@@ -0,0 +1,199 @@
+import asyncio
+import collections
+import json
+import queue
+import threading
+
+SAMPLE_FIELDS = ("day", "healthy", "latent", "active", "dead", "new_infected", "new_dead", "step_seconds", "r_t",
+                 "generation_interval")
+STATES = ("healthy", "latent", "active", "dead")
+
+
+class MetricsServer:
+    # Simulation loops only append to an in-memory inbox; a background thread running an asyncio loop drains it in
+    # batches every flush_interval seconds and serves
+    #   GET /metrics  the latest sample of every run as Prometheus text
+    #   GET /stream   every sample as newline-delimited JSON, kept open and written batch by batch
+    # so a slow or stuck client can never hold up a simulation step
+
+    def __init__(self, host="127.0.0.1", port=0, flush_interval=0.5, backlog=10000):
+        self.host = host
+        self.port = port
+        self.flush_interval = flush_interval
+        self._inbox = collections.deque()
+        self._latest = {}
+        self._totals = {}
+        self._backlog = collections.deque(maxlen=backlog)
+        self._streams = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._error = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-server", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+    def publish(self, run, sample):
+        # deque.append is atomic, so no lock is taken on the simulation thread
+        self._inbox.append((str(run), dict(sample)))
+
+    def publish_batch(self, items):
+        self._inbox.extend((str(run), dict(sample)) for run, sample in items)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self._server = loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop = loop
+        self._started.set()
+        flusher = loop.create_task(self._flush_periodically())
+        try:
+            loop.run_forever()
+        finally:
+            flusher.cancel()
+            self._flush()
+            self._server.close()
+            for writer in list(self._streams):
+                writer.close()
+            loop.run_until_complete(asyncio.gather(flusher, return_exceptions=True))
+            loop.close()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._flush()
+
+    def _flush(self):
+        batch = []
+        while self._inbox:
+            batch.append(self._inbox.popleft())
+        if not batch:
+            return
+
+        lines = []
+        for run, sample in batch:
+            self._latest[run] = sample
+            totals = self._totals.setdefault(run, {"infected": 0, "dead": 0})
+            totals["infected"] += sample.get("new_infected", 0)
+            totals["dead"] += sample.get("new_dead", 0)
+            record = {"run": run, **sample}
+            self._backlog.append(record)
+            lines.append(json.dumps(record))
+        payload = ("\n".join(lines) + "\n").encode()
+        for writer in list(self._streams):
+            if writer.is_closing():
+                self._streams.discard(writer)
+            elif writer.transport.get_write_buffer_size() > 1 << 20:
+                # The client stopped reading; drop it rather than buffer without bound
+                writer.close()
+                self._streams.discard(writer)
+            else:
+                writer.write(payload)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()).strip():
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+        path = request_line[1].split("?")[0] if len(request_line) > 1 else "/"
+
+        if path == "/metrics":
+            self._flush()
+            body = self.prometheus_text().encode()
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        elif path == "/stream":
+            self._flush()
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: application/x-ndjson\r\n\r\n")
+            writer.write("".join(json.dumps(record) + "\n" for record in self._backlog).encode())
+            self._streams.add(writer)
+            return
+        else:
+            writer.write(b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP simulation_cells Cells in each state at the end of the latest day.",
+            "# TYPE simulation_cells gauge",
+        ]
+        for run, sample in sorted(self._latest.items()):
+            for state in STATES:
+                lines.append(f'simulation_cells{{run="{run}",state="{state}"}} {sample.get(state, 0)}')
+        gauges = (
+            ("simulation_day", "day", "Latest finished simulated day."),
+            ("simulation_new_infected", "new_infected", "Cells that became infectious during the latest day."),
+            ("simulation_new_dead", "new_dead", "Cells that died during the latest day."),
+            ("simulation_step_seconds", "step_seconds", "Mean wall-clock seconds per step over the latest day."),
+            ("simulation_reproduction_number", "r_t", "Rolling estimate of the reproduction number R_t."),
+            ("simulation_generation_interval_days", "generation_interval",
+             "Rolling mean days from an infector turning infectious to a transmission."),
+        )
+        for name, field, help_text in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for run, sample in sorted(self._latest.items()):
+                value = sample.get(field, 0)
+                lines.append(f'{name}{{run="{run}"}} {"NaN" if value is None else value}')
+        for name, field in (("simulation_infected_total", "infected"), ("simulation_dead_total", "dead")):
+            lines += [f"# HELP {name} Cumulative {field} count since the run started.", f"# TYPE {name} counter"]
+            for run, totals in sorted(self._totals.items()):
+                lines.append(f'{name}{{run="{run}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
+
+
+class QueuePublisher:
+    # For worker processes: samples are collected locally and handed to the parent's queue every batch_size days
+
+    def __init__(self, sample_queue, batch_size=10):
+        self.sample_queue = sample_queue
+        self.batch_size = batch_size
+        self._batch = []
+
+    def publish(self, run, sample):
+        self._batch.append((run, sample))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            self.sample_queue.put(self._batch)
+            self._batch = []
+
+
+def forward_queue(sample_queue, server, stop_event):
+    # Parent side of QueuePublisher: moves batches from the queue into the server until stop_event is set
+    while not stop_event.is_set() or not sample_queue.empty():
+        try:
+            server.publish_batch(sample_queue.get(timeout=0.2))
+        except queue.Empty:
+            continue
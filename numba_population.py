@@ -0,0 +1,189 @@
+import math
+
+import numpy as np
+from cell_population import HEALTHY, CellPopulation
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None
+
+
+def _jit(function):
+    return numba.njit(cache=True, nogil=True)(function) if AVAILABLE else function
+
+
+@_jit
+def _inside(px, py, ring_x, ring_y, mask, min_x, min_y, resolution):
+    if resolution > 0:
+        column = int(math.floor((px - min_x) * resolution))
+        row = int(math.floor((py - min_y) * resolution))
+        if column < 0 or row < 0 or row >= mask.shape[0] or column >= mask.shape[1]:
+            return False
+        return mask[row, column]
+
+    # Even-odd ray casting over the closed exterior ring
+    inside = False
+    j = len(ring_x) - 1
+    for i in range(len(ring_x)):
+        if (ring_y[i] > py) != (ring_y[j] > py):
+            crossing = (ring_x[j] - ring_x[i]) * (py - ring_y[i]) / (ring_y[j] - ring_y[i]) + ring_x[i]
+            if px < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+@_jit
+def _advance(x, y, speed_x, speed_y, alive, change_x, change_y, max_speed, ring_x, ring_y, mask, min_x, min_y,
+             resolution):
+    inside = np.empty(alive.size, dtype=np.bool_)
+    for k in range(alive.size):
+        i = alive[k]
+        sx = min(max(speed_x[i] + change_x[k], -max_speed), max_speed)
+        sy = min(max(speed_y[i] + change_y[k], -max_speed), max_speed)
+        speed_x[i] = sx
+        speed_y[i] = sy
+        new_x = x[i] + sx
+        new_y = y[i] + sy
+        inside[k] = _inside(new_x, new_y, ring_x, ring_y, mask, min_x, min_y, resolution)
+        if inside[k]:
+            x[i] = new_x
+            y[i] = new_y
+    return inside
+
+
+@_jit
+def _bounce(speed_x, speed_y, outside, perturb, nudge_x, nudge_y):
+    n = 0
+    for k in range(outside.size):
+        i = outside[k]
+        if perturb[k]:
+            speed = math.hypot(speed_x[i], speed_y[i])
+            sx = speed_x[i] + nudge_x[n]
+            sy = speed_y[i] + nudge_y[n]
+            n += 1
+            new_speed = math.hypot(sx, sy)
+            ratio = speed / new_speed if new_speed > 0 else 1.0
+            speed_x[i] = sx * ratio
+            speed_y[i] = sy * ratio
+        else:
+            speed_x[i] = -speed_x[i]
+            speed_y[i] = -speed_y[i]
+
+
+@_jit
+def _scan_pairs(px, py, query_ids, keys, grid_x, grid_y, grid_ids, origin_x, origin_y, cell_size, columns, rows,
+                reach, radius, day_offsets, table, state, prob_healthy, prob_latent, alpha, draws, infector):
+    # Visits candidates in the same order as SpatialGrid.pairs_within; with draws empty it only counts,
+    # otherwise it consumes one draw per pair exactly like CellPopulation.infect and credits each infected target
+    # to its first successful contact, in infector[p] for the target at grid position p
+    hits = 0
+    candidates = 0
+    radius_sq = radius ** 2
+    last = len(table) - 1
+    for q in range(px.size):
+        bucket_x = np.int64((px[q] - origin_x) // cell_size)
+        bucket_y = np.int64((py[q] - origin_y) // cell_size)
+        for dx in range(-reach, reach + 1):
+            column = bucket_x + dx
+            if column < 0 or column >= columns:
+                continue
+            for dy in range(-reach, reach + 1):
+                row = bucket_y + dy
+                if row < 0 or row >= rows:
+                    continue
+                key = row * columns + column
+                start = np.searchsorted(keys, key, side="left")
+                end = np.searchsorted(keys, key, side="right")
+                candidates += end - start
+                for p in range(start, end):
+                    if (grid_x[p] - px[q]) ** 2 + (grid_y[p] - py[q]) ** 2 > radius_sq:
+                        continue
+                    target = grid_ids[p]
+                    if target == query_ids[q]:
+                        continue
+                    if draws.size:
+                        day = min(max(day_offsets[q], 0), last)
+                        target_prob = prob_healthy if state[target] == HEALTHY else prob_latent
+                        alpha[query_ids[q]] = 255
+                        if draws[hits] < table[day] * target_prob and infector[p] < 0:
+                            infector[p] = query_ids[q]
+                    hits += 1
+    return hits, candidates
+
+
+class NumbaCellPopulation(CellPopulation):
+    # Same state layout and random stream as CellPopulation, with the movement and infection loops compiled;
+    # every random number is still drawn from self.rng in the same order, so seeded runs match the NumPy engine
+    NO_MASK = np.zeros((1, 1), dtype=np.bool_)
+
+    def __init__(self, *args, **kwargs):
+        if not AVAILABLE:
+            raise ValueError("The numba engine needs the numba package.")
+        super().__init__(*args, **kwargs)
+        self._region = None
+        self._ring = None
+
+    def _region_arrays(self, region):
+        if region is not self._region:
+            ring = np.asarray(region.polygon.exterior.coords, dtype=np.float64)
+            if region.mask is not None:
+                mask, resolution = region.mask, float(region.mask_resolution)
+            else:
+                mask, resolution = self.NO_MASK, 0.0
+            self._ring = (ring[:, 0].copy(), ring[:, 1].copy(), mask, region.bounds[0], region.bounds[1], resolution)
+            self._region = region
+        return self._ring
+
+    def _move(self, region, alive):
+        if alive.size == 0:
+            return
+
+        if self.randomize_movement:
+            change_x, change_y = self.rng.uniform(-self.SPEED_CHANGE_FACTOR, self.SPEED_CHANGE_FACTOR, (2, alive.size))
+        else:
+            change_x = change_y = np.zeros(alive.size)
+        inside = _advance(self.x, self.y, self.speed_x, self.speed_y, alive, change_x, change_y, self.MAX_SPEED,
+                          *self._region_arrays(region))
+
+        outside = alive[~inside]
+        if outside.size:
+            perturb = self.rng.random(outside.size) < 0.2
+            nudge_x, nudge_y = self.rng.uniform(-0.5, 0.5, (2, perturb.sum()))
+            _bounce(self.speed_x, self.speed_y, outside, perturb, nudge_x, nudge_y)
+
+    def spread(self, grid, infection_radius, infection_prob_healthy, infection_prob_latent, contagiousness):
+        infectors = self.active_cells
+        if infectors.size == 0:
+            return 0
+        susceptible = self.susceptible_cells(infectors, infection_radius)
+        if susceptible.size == 0:
+            return 0
+
+        grid.rebuild(self.x[susceptible], self.y[susceptible], susceptible)
+        if len(grid) == 0:
+            return 0
+        reach = max(1, math.ceil(infection_radius / grid.cell_size))
+        day_offsets = self.current_day - self.infection_start_day[infectors]
+        # Shared by both passes; only the trailing draws and infector buffer differ
+        scan = (self.x[infectors], self.y[infectors], infectors, grid._keys, grid.x, grid.y, grid.ids,
+                grid._origin_x, grid._origin_y, grid.cell_size, grid._columns, grid._rows, reach,
+                float(infection_radius), day_offsets, contagiousness.table, self.state, float(infection_prob_healthy),
+                float(infection_prob_latent), self.infection_alpha)
+
+        hits, candidates = _scan_pairs(*scan, draws=np.empty(0), infector=np.empty(0, dtype=np.int32))
+        grid.candidates_tested += int(candidates)
+        if hits == 0:
+            return 0
+
+        # Indexed by grid position, so the buffer is as long as the susceptible subset rather than the population
+        infector = np.full(len(grid), -1, dtype=np.int32)
+        _scan_pairs(*scan, draws=self.rng.random(hits), infector=infector)
+        hit = np.flatnonzero(infector >= 0)
+        # In ascending cell order, as the other engines apply them
+        order = np.argsort(grid.ids[hit])
+        self.apply_infections(grid.ids[hit][order].astype(np.intp), infector[hit][order].astype(np.intp))
+        return hits
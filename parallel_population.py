@@ -0,0 +1,224 @@
+import multiprocessing
+import os
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+from cell_population import DEAD, HEALTHY, LATENT, CellPopulation
+from config import Config
+from region import Region
+from spatial_grid import SpatialGrid
+
+
+def _attach(specs):
+    blocks = {}
+    arrays = {}
+    for name, (block_name, dtype, count) in specs.items():
+        blocks[name] = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(count, dtype=dtype, buffer=blocks[name].buf)
+    return blocks, arrays
+
+
+def _worker_main(connection, index, specs, config_options):
+    # Each worker owns the live cells whose x falls inside its strip; it reads every cell through shared memory, so
+    # the halo (infectors up to infection_radius outside the strip) needs no copying, and only writes its own cells.
+    # The owned indices are kept sorted between commands: a move hands the cells that left the strip back to the
+    # parent, which passes them on to their new strip with the next command
+    config = Config(**config_options)
+    blocks, arrays = _attach(specs)
+    population = CellPopulation(np.empty(0), np.empty(0), config.cell_speed, size=config.cell_size,
+                                infection_period=config.infection_period)
+    population.use_arrays(arrays)
+    region = Region(config.polygon_points, mask_resolution=config.containment_resolution)
+    grid = SpatialGrid(config.infection_radius or 1)
+    contagiousness = config.contagiousness_table()
+    owned = np.empty(0, dtype=np.intp)
+    try:
+        while True:
+            command, entropy, lower, upper, handover, arguments = connection.recv()
+            if command == "stop":
+                break
+            population.rng = np.random.default_rng([entropy, index])
+            try:
+                reset, arrivals = handover
+                if reset:
+                    owned = arrivals
+                elif arrivals.size:
+                    owned = np.insert(owned, np.searchsorted(owned, arrivals), arrivals)
+                if command == "move":
+                    owned = owned[population.state[owned] != DEAD]
+                    population.move(region, owned)
+                    x = population.x[owned]
+                    leaving = (x < lower) | (x >= upper)
+                    connection.send(owned[leaving])
+                    owned = owned[~leaving]
+                else:
+                    connection.send(_spread(arguments, population, grid, contagiousness, owned))
+            except Exception as e:
+                connection.send(e)
+    finally:
+        del population, arrays
+        for block in blocks.values():
+            block.close()
+
+
+def _spread(arguments, population, grid, contagiousness, owned):
+    # The parent picks the infectors from its active index, so no pass here touches more than the strip's own cells
+    current_day, infection_radius, prob_healthy, prob_latent, infectors = arguments
+    population.current_day = current_day
+    state = population.state[owned]
+    susceptible = owned[(state == HEALTHY) | (state == LATENT)]
+    candidates = grid.candidates_tested
+    sources, targets = population.pairs_within(grid, infection_radius, infectors, susceptible)
+    infected, infectors = population.draw_infections(sources, targets, prob_healthy, prob_latent, contagiousness)
+    return infected, infectors, sources.size, grid.candidates_tested - candidates
+
+
+def _shutdown(connections, processes, blocks):
+    for connection in connections:
+        try:
+            connection.send(("stop", 0, 0, 0, None, None))
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    for block in blocks.values():
+        block.close()
+        block.unlink()
+
+
+class ParallelCellPopulation(CellPopulation):
+    # The polygon is split into vertical strips holding roughly equal numbers of live cells, one per worker process;
+    # strip edges are re-balanced once a day. Workers draw from per-step streams seeded by self.rng, so a seeded run
+    # is reproducible for a given worker count and resumes exactly from checkpoints. Per step there is one round
+    # trip for the move and, on infection checks, one for the spread
+    def __init__(self, x, y, speed, size=3, infection_period=10, rng=None, on_state_change=None, config=None,
+                 **storage):
+        # Compact dtypes carry over to the shared blocks; a storage directory only backs the arrays until they are
+        # copied there
+        super().__init__(x, y, speed, size=size, infection_period=infection_period, rng=rng,
+                         on_state_change=on_state_change, **storage)
+        config = config or Config()
+        self.workers = max(1, int(config.parallel_workers or os.cpu_count() or 1))
+        self._blocks = {}
+        specs = {}
+        arrays = {}
+        for name in self.ARRAYS:
+            values = getattr(self, name)
+            block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+            self._blocks[name] = block
+            arrays[name] = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+            arrays[name][:] = values
+            specs[name] = (block.name, values.dtype.str, len(values))
+        super().close()
+        self.use_arrays(arrays)
+
+        context = multiprocessing.get_context("spawn")
+        self._connections = []
+        self._processes = []
+        for index in range(self.workers):
+            connection, child = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child, index, specs, config.to_dict()), daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._finalizer = weakref.finalize(self, _shutdown, self._connections, self._processes, self._blocks)
+        self.boundaries = None
+        self._rebalance = False
+        # Indices each worker takes over with its next command, and whether they replace what it owns
+        self._handover = None
+        self.balance()
+
+    def load_arrays(self, arrays):
+        # Copy into the shared blocks the workers already map
+        for name in self.ARRAYS:
+            if name in arrays:
+                getattr(self, name)[:] = arrays[name]
+        self.reindex()
+        self.balance()
+
+    def close(self):
+        self._finalizer()
+
+    def place(self, cells, x, y):
+        super().place(cells, x, y)
+        self._assign()
+
+    def balance(self):
+        alive = np.flatnonzero(self.state != DEAD)
+        if alive.size == 0:
+            edges = np.zeros(self.workers - 1)
+        else:
+            edges = np.quantile(self.x[alive], np.arange(1, self.workers) / self.workers)
+        self.boundaries = np.concatenate([[-np.inf], edges, [np.inf]])
+        self._assign(alive)
+
+    def _assign(self, alive=None):
+        # Hands every live cell to the strip its x falls in, replacing what the workers own; a stable sort keeps each
+        # strip's indices ascending
+        if alive is None:
+            alive = np.flatnonzero(self.state != DEAD)
+        strips = self._strips(alive)
+        order = np.argsort(strips, kind="stable")
+        owned = np.split(alive[order], np.cumsum(np.bincount(strips, minlength=self.workers))[:-1])
+        self._handover = [(True, cells) for cells in owned]
+
+    def _strips(self, cells):
+        return np.searchsorted(self.boundaries, self.x[cells], side="right") - 1
+
+    def _run(self, command, arguments=None):
+        entropy = int(self.rng.integers(2 ** 63))
+        handover = self._handover or [(False, np.empty(0, dtype=np.intp))] * self.workers
+        self._handover = None
+        for index, connection in enumerate(self._connections):
+            worker_arguments = arguments[index] if isinstance(arguments, list) else arguments
+            connection.send((command, entropy, self.boundaries[index], self.boundaries[index + 1], handover[index],
+                             worker_arguments))
+        results = [connection.recv() for connection in self._connections]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def move(self, region, cells=None):
+        if cells is not None:
+            super().move(region, cells)
+            return
+        # Workers return the cells that crossed a strip edge; each goes to the strip it landed in
+        leaving = np.concatenate(self._run("move"))
+        if leaving.size:
+            leaving.sort()
+            strips = self._strips(leaving)
+            self._handover = [(False, leaving[strips == index]) for index in range(self.workers)]
+        if self._rebalance:
+            # After the move that closes the day, so a checkpoint taken at the day boundary restores the same strips
+            self.balance()
+            self._rebalance = False
+
+    def update_state(self, death_probability, latent_to_active_probability, current_day):
+        super().update_state(death_probability, latent_to_active_probability, current_day)
+        self._rebalance = True
+
+    def spread(self, grid, infection_radius, infection_prob_healthy, infection_prob_latent, contagiousness):
+        # Infectors up to infection_radius beyond each strip's edges, ascending
+        active = self.active_cells
+        x = self.x[active]
+        arguments = [(self.current_day, float(infection_radius), infection_prob_healthy, infection_prob_latent,
+                      active[(x >= lower - infection_radius) & (x < upper + infection_radius)])
+                     for lower, upper in zip(self.boundaries[:-1], self.boundaries[1:])]
+        results = self._run("spread", arguments)
+        attempts = 0
+        infected = []
+        infectors = []
+        for worker_infected, worker_infectors, worker_attempts, candidates in results:
+            infected.append(worker_infected)
+            infectors.append(worker_infectors)
+            attempts += worker_attempts
+            grid.candidates_tested += candidates
+        # Workers never touch states; all infections of the pass are applied here at once. A target belongs to one
+        # strip only, so no cell is credited twice
+        self.apply_infections(np.concatenate(infected).astype(np.intp), np.concatenate(infectors).astype(np.intp))
+        return attempts
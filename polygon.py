@@ -1,14 +1,10 @@
-from game_widget import GameWidget
-
-
 class Polygon:
+    PRESETS = ("trench", "office", "open_area")
 
     def __init__(self, polygon_type=None):
         self.polygon_type = polygon_type
         self.current_polygon = []
 
-        self.game_widget = GameWidget()
-
     @staticmethod
     def create_trench():
         return [
@@ -50,6 +46,12 @@ class Polygon:
     def create_open_area():
         return [(0, 0), (600, 0), (600, 400), (0, 400)], 1.0
 
+    @staticmethod
+    def create_preset(name):
+        if name not in Polygon.PRESETS:
+            raise ValueError(f"Unknown polygon type: {name}")
+        return getattr(Polygon, f"create_{name}")()
+
     # def generate_polygon(self, polygon_type):
     #     try:
     #         if polygon_type == "Trench":
@@ -0,0 +1,81 @@
+import contextlib
+import time
+from collections import defaultdict
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    # Each phase keeps its last WINDOW durations in a ring, so percentiles follow the current part of the run;
+    # while disabled measure() hands out a shared no-op context and count() returns immediately
+    WINDOW = 512
+
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._null = contextlib.nullcontext()
+        self.reset()
+
+    def reset(self):
+        self._samples = {}
+        self._calls = defaultdict(int)
+        self._totals = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def measure(self, name):
+        return _Phase(self, name) if self.enabled else self._null
+
+    def record(self, name, seconds):
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = np.zeros(self.window)
+        samples[self._calls[name] % self.window] = seconds
+        self._calls[name] += 1
+        self._totals[name] += seconds
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += int(amount)
+
+    def snapshot(self):
+        phases = {}
+        for name, samples in list(self._samples.items()):
+            calls = self._calls[name]
+            recent = samples[:min(calls, self.window)]
+            p50, p90, p99 = np.percentile(recent, PERCENTILES)
+            phases[name] = {
+                "calls": calls,
+                "total": self._totals[name],
+                "mean": self._totals[name] / calls,
+                "p50": float(p50),
+                "p90": float(p90),
+                "p99": float(p99),
+                "max": float(recent.max()),
+            }
+        return {"phases": phases, "counters": dict(self.counters)}
+
+    def format_report(self):
+        snapshot = self.snapshot()
+        lines = [f"{'phase':<10}{'calls':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'total s':>9}"]
+        for name, phase in sorted(snapshot["phases"].items()):
+            lines.append(f"{name:<10}{phase['calls']:>8}{phase['p50'] * 1000:>9.2f}{phase['p90'] * 1000:>9.2f}"
+                         f"{phase['p99'] * 1000:>9.2f}{phase['total']:>9.2f}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name:<20}{value:>16}")
+        return "\n".join(lines)
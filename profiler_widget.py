@@ -0,0 +1,49 @@
+from PyQt5.QtWidgets import QGroupBox, QVBoxLayout, QHBoxLayout, QCheckBox, QLabel, QPushButton
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QFontDatabase
+
+
+class ProfilerWidget(QGroupBox):
+    REFRESH_INTERVAL_MS = 500
+
+    def __init__(self, game_widget, parent=None):
+        super().__init__("Profiling", parent)
+        self.game_widget = game_widget
+
+        self.enable_checkbox = QCheckBox("Enable Profiling")
+        self.enable_checkbox.setChecked(False)
+        self.enable_checkbox.stateChanged.connect(self.set_enabled)
+
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+
+        self.report_label = QLabel("Profiling is off.")
+        self.report_label.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+
+        header_layout = QHBoxLayout()
+        header_layout.addWidget(self.enable_checkbox)
+        header_layout.addWidget(reset_button)
+
+        layout = QVBoxLayout()
+        layout.addLayout(header_layout)
+        layout.addWidget(self.report_label)
+        self.setLayout(layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def set_enabled(self, state):
+        self.game_widget.set_profiling(bool(state))
+        if state:
+            self.refresh_timer.start(self.REFRESH_INTERVAL_MS)
+        else:
+            self.refresh_timer.stop()
+            self.report_label.setText("Profiling is off.")
+
+    def reset(self):
+        self.game_widget.profiler.reset()
+        self.refresh()
+
+    def refresh(self):
+        if self.isVisible():
+            self.report_label.setText(self.game_widget.profiler.format_report())
@@ -0,0 +1,85 @@
+import math
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+
+class Region:
+    def __init__(self, polygon_points, mask_resolution=None):
+        self.polygon = Polygon(polygon_points)
+        shapely.prepare(self.polygon)
+        self.bounds = self.polygon.bounds
+        self.triangles = self._triangulate(list(self.polygon.exterior.coords)[:-1])
+        ab = self.triangles[:, 1] - self.triangles[:, 0]
+        ac = self.triangles[:, 2] - self.triangles[:, 0]
+        self._areas = np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]) / 2
+        self.mask_resolution = mask_resolution
+        self.mask = self._rasterize(mask_resolution) if mask_resolution else None
+
+    def contains(self, x, y):
+        if self.mask is None:
+            return shapely.contains_xy(self.polygon, x, y)
+
+        # Approximate lookup: a point is inside if the mask pixel it falls in has its centre inside
+        min_x, min_y = self.bounds[0], self.bounds[1]
+        column = np.floor((np.asarray(x) - min_x) * self.mask_resolution).astype(np.int64)
+        row = np.floor((np.asarray(y) - min_y) * self.mask_resolution).astype(np.int64)
+        rows, columns = self.mask.shape
+        valid = (column >= 0) & (column < columns) & (row >= 0) & (row < rows)
+        inside = np.zeros(valid.shape, dtype=bool)
+        inside[valid] = self.mask[row[valid], column[valid]]
+        return inside
+
+    def sample(self, count, rng):
+        chosen = rng.choice(len(self.triangles), size=count, p=self._areas / self._areas.sum())
+        a, b, c = self.triangles[chosen, 0], self.triangles[chosen, 1], self.triangles[chosen, 2]
+        u = rng.random(count)
+        v = rng.random(count)
+        # Fold points from the far half of the parallelogram back into the triangle
+        flip = u + v > 1
+        u[flip] = 1 - u[flip]
+        v[flip] = 1 - v[flip]
+        points = a + u[:, None] * (b - a) + v[:, None] * (c - a)
+        return points[:, 0], points[:, 1]
+
+    def _rasterize(self, resolution):
+        min_x, min_y, max_x, max_y = self.bounds
+        columns = max(1, math.ceil((max_x - min_x) * resolution))
+        rows = max(1, math.ceil((max_y - min_y) * resolution))
+        centre_x = min_x + (np.arange(columns) + 0.5) / resolution
+        centre_y = min_y + (np.arange(rows) + 0.5) / resolution
+        grid_x, grid_y = np.meshgrid(centre_x, centre_y)
+        return shapely.contains_xy(self.polygon, grid_x, grid_y)
+
+    @staticmethod
+    def _triangulate(points):
+        # Ear clipping; the simulation polygons are simple rings without holes
+        points = [tuple(map(float, p)) for p in points]
+        signed_area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))
+        if signed_area < 0:
+            points.reverse()
+
+        def cross(o, a, b):
+            return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+        def inside_triangle(p, a, b, c):
+            return cross(a, b, p) >= 0 and cross(b, c, p) >= 0 and cross(c, a, p) >= 0
+
+        remaining = list(range(len(points)))
+        triangles = []
+        while len(remaining) > 3:
+            for k in range(len(remaining)):
+                i, j, l = remaining[k - 1], remaining[k], remaining[(k + 1) % len(remaining)]
+                a, b, c = points[i], points[j], points[l]
+                if cross(a, b, c) <= 0:
+                    continue
+                if any(inside_triangle(points[m], a, b, c) for m in remaining if m not in (i, j, l)):
+                    continue
+                triangles.append((a, b, c))
+                del remaining[k]
+                break
+            else:
+                raise ValueError("Polygon is not simple and cannot be triangulated.")
+        triangles.append(tuple(points[m] for m in remaining))
+        return np.array(triangles, dtype=np.float64)
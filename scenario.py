@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+
+from cell_automaton import ENGINES, resolve_engine
+from config import Config
+from polygon import Polygon
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+# Bump whenever a model change alters what a seeded scenario produces, so stale cached results stop matching
+MODEL_VERSION = 3
+
+# Settings that only change how a run looks, never its numbers
+APPEARANCE = ("show_radius", "color_healthy", "color_latent", "color_active", "color_dead", "background_color")
+
+# Config's unused infection_probability is not a setting (to_dict leaves it out), so scenarios cannot set it either
+PROBABILITIES = ("latent_prob", "latent_to_active_prob", "infection_prob_latent", "infection_prob_healthy",
+                 "death_probability")
+
+COUNTS = ("cell_count", "infected_count", "iterations_per_day", "infection_checks_per_iter", "infection_period")
+
+# Keys whose Config default is None, with the type they take when set
+OPTIONAL_TYPES = {"containment_resolution": float, "seed": int, "parallel_workers": int, "storage_directory": str,
+                  "chunk_size": int}
+
+
+def load_scenario(path):
+    """Read a JSON or TOML scenario file and return validated Config keyword arguments.
+
+    Besides any Config argument the file may hold "polygon", either a preset
+    name or a list of [x, y] points, and "days", the run length.
+    """
+    if os.path.splitext(str(path))[1].lower() == ".toml":
+        if tomllib is None:
+            raise ValueError("TOML scenarios need Python 3.11 or newer.")
+        with open(path, "rb") as f:
+            try:
+                data = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"{path}: {e}") from None
+    else:
+        with open(path) as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: {e}") from None
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: a scenario must be a table of settings.")
+    return validate_scenario(data)
+
+
+def validate_scenario(data):
+    defaults = Config().to_dict()
+    options = {}
+    for name, value in data.items():
+        if name == "polygon":
+            if "polygon_points" in data:
+                raise ValueError("Give either polygon or polygon_points, not both.")
+            if isinstance(value, str):
+                options["polygon_points"], _ = Polygon.create_preset(value)
+            else:
+                options["polygon_points"] = _points(value)
+        elif name == "polygon_points":
+            options[name] = _points(value)
+        elif name == "days":
+            options[name] = _number(name, value, int, minimum=1)
+        elif name in OPTIONAL_TYPES and OPTIONAL_TYPES[name] is str:
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f"{name} must be a string.")
+            options[name] = value
+        elif name in OPTIONAL_TYPES:
+            options[name] = None if value is None else _number(name, value, OPTIONAL_TYPES[name], minimum=0)
+        elif name not in defaults:
+            raise ValueError(f"Unknown scenario setting: {name}")
+        else:
+            options[name] = _typed(name, value, defaults[name])
+
+    for name in PROBABILITIES:
+        if name in options and not 0 <= options[name] <= 1:
+            raise ValueError(f"{name} must be between 0 and 1.")
+    for name in COUNTS[:1] + COUNTS[2:]:
+        if name in options and options[name] < 1:
+            raise ValueError(f"{name} must be at least 1.")
+    for name in ("infected_count", "infection_radius", "cell_speed", "cell_size"):
+        if name in options and options[name] < 0:
+            raise ValueError(f"{name} must not be negative.")
+    if options.get("infected_count", 0) > options.get("cell_count", defaults["cell_count"]):
+        raise ValueError("infected_count must not exceed cell_count.")
+    if options.get("engine", "auto") not in ENGINES:
+        raise ValueError(f"Unknown engine: {options['engine']}")
+    return options
+
+
+def _typed(name, value, default):
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{name} must be true or false.")
+        return value
+    if isinstance(default, (int, float)):
+        return _number(name, value, int if name in COUNTS else float)
+    if isinstance(default, str):
+        if not isinstance(value, str):
+            raise ValueError(f"{name} must be a string.")
+        return value
+    if isinstance(default, tuple):
+        if not isinstance(value, (list, tuple)) or len(value) != len(default):
+            raise ValueError(f"{name} must be a list of {len(default)} numbers.")
+        return tuple(_number(name, item, float) for item in value)
+    return value
+
+
+def _number(name, value, value_type, minimum=None):
+    # An int setting takes whole numbers only; a float setting takes ints too
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or (value_type is int and value != int(value)):
+        raise ValueError(f"{name} must be {'an integer' if value_type is int else 'a number'}.")
+    value = value_type(value)
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}.")
+    return value
+
+
+def _points(value):
+    if not isinstance(value, (list, tuple)) or len(value) < 3:
+        raise ValueError("A polygon needs at least 3 points.")
+    points = []
+    for point in value:
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            raise ValueError(f"Polygon points must be [x, y] pairs, got {point!r}.")
+        points.append((_number("polygon point", point[0], float), _number("polygon point", point[1], float)))
+    return points
+
+
+def _canonical(value):
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        # 10 and 10.0 configure the same run
+        return int(value)
+    return value
+
+
+def scenario_key(config, days, stop_when_no_infected=False):
+    """Content hash of everything that decides a run's daily counts, or None for unseeded configs."""
+    if config.seed is None:
+        return None
+    settings = config.to_dict()
+    for name in APPEARANCE:
+        settings.pop(name, None)
+    # "auto" and numba draw the same random stream as the NumPy engine, so their results are interchangeable; mapping
+    # them without resolving "auto" also keeps hashing from importing numba
+    engine = config.engine
+    settings["engine"] = "population" if engine in ("auto", "numba") else engine
+    if config.compact_storage and engine in ("auto", "numba"):
+        # float32 arithmetic rounds differently in the compiled kernels, so compact runs are only per-engine repeatable
+        settings["engine"] = resolve_engine(engine, config.cell_count)
+    if engine != "parallel":
+        settings.pop("parallel_workers", None)
+    # Where the arrays live does not matter, only whether stepping is chunked
+    settings.pop("storage_directory", None)
+    settings["chunk_size"] = config.resolved_chunk_size()
+    settings.update(days=days, stop_when_no_infected=bool(stop_when_no_infected), model_version=MODEL_VERSION)
+    text = json.dumps({name: _canonical(value) for name, value in settings.items()}, sort_keys=True,
+                      separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def save_scenario(path, config, days=None):
+    # JSON only; TOML has no writer in the standard library
+    settings = {name: _canonical(value) for name, value in config.to_dict().items() if name not in APPEARANCE}
+    if days is not None:
+        settings["days"] = days
+    with open(path, "w") as f:
+        json.dump(settings, f, indent=2)
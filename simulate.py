@@ -0,0 +1,316 @@
+import argparse
+import csv
+import json
+import logging
+import math
+import sys
+import time
+
+import numpy as np
+
+from cell_automaton import CellAutomaton
+from checkpoint import load_checkpoint, save_checkpoint
+from config import Config
+from infection_log import ESTIMATES
+from polygon import Polygon
+from profiler import Profiler
+from scenario import load_scenario, scenario_key, validate_scenario
+from trajectory import TrajectoryRecorder
+
+TRACE_FIELDS = ("day", "infector", "target", "target_state", "probability")
+
+COLUMNS = ("day", "healthy", "latent", "active", "dead", "new_infected", "new_dead")
+
+DEFAULT_DAYS = 100
+
+def parse_bool(text):
+    value = text.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    raise argparse.ArgumentTypeError(f"Not a boolean: {text}")
+
+
+CONFIG_OPTIONS = (
+    ("cell_count", int),
+    ("infected_count", int),
+    ("latent_prob", float),
+    ("iterations_per_day", int),
+    ("infection_checks_per_iter", int),
+    ("infection_radius", float),
+    ("infection_period", int),
+    ("latent_to_active_prob", float),
+    ("infection_prob_latent", float),
+    ("infection_prob_healthy", float),
+    ("cell_speed", float),
+    ("death_probability", float),
+    ("cell_size", float),
+    ("containment_resolution", float),
+    ("engine", str),
+    ("parallel_workers", int),
+    ("fast_forward", parse_bool),
+    ("compact_storage", parse_bool),
+    ("storage_directory", str),
+    ("chunk_size", int),
+    ("seed", int),
+)
+
+
+def run_simulation(config: Config, days, stop_when_no_infected=False, checkpoint_path=None, checkpoint_every=0,
+                   resume_from=None, record_path=None, record_every=1, profiler=None, publish=None, cache=None,
+                   infection_log_path=None):
+    key = None
+    if cache is not None and not (resume_from or checkpoint_path or record_path or infection_log_path):
+        # Seeded runs are deterministic, so a stored result is exactly what stepping would produce
+        key = scenario_key(config, days, stop_when_no_infected)
+        cached = cache.get(key) if key else None
+        if cached is not None:
+            if publish:
+                for index in range(len(cached["day"])):
+                    sample = {column: int(cached[column][index]) for column in COLUMNS}
+                    sample.update(_estimate_fields({name: cached[name][index] for name in ESTIMATES}))
+                    publish({**sample, "step_seconds": 0.0})
+            return cached
+
+    if resume_from:
+        # The checkpoint carries its own config and the rows recorded before it was written
+        automaton, current_iteration, history = load_checkpoint(resume_from)
+        config = automaton.config
+        rows = [tuple(row) for row in history.tolist()]
+    else:
+        automaton = CellAutomaton(config)
+        current_iteration = 0
+        healthy, active, latent, dead = automaton.get_statistics()
+        rows = [(0, healthy, latent, active, dead, 0, 0)]
+    if profiler is not None:
+        automaton.profiler = profiler
+
+    recorder = None
+    if record_path:
+        recorder = TrajectoryRecorder(record_path, config.cell_count, config, record_every=record_every)
+        step_seconds = 0.0
+
+    current_day = automaton.current_day
+    day_started = time.perf_counter()
+    day_iteration = current_iteration
+    try:
+        while current_day < days:
+            current_iteration += 1
+            day_finished = current_iteration % config.iterations_per_day == 0
+            if day_finished:
+                current_day += 1
+
+            if recorder:
+                start = time.perf_counter()
+                automaton.update(current_iteration, current_day)
+                step_seconds += time.perf_counter() - start
+                recorder.record(current_iteration, current_day, *automaton.get_positions_and_states())
+            else:
+                automaton.update(current_iteration, current_day)
+
+            if day_finished:
+                healthy, active, latent, dead = automaton.get_statistics()
+                incidence = automaton.reset_daily_statistics()
+                rows.append((current_day, healthy, latent, active, dead, incidence["infected"], incidence["dead"]))
+                if publish:
+                    now = time.perf_counter()
+                    sample = {column: int(value) for column, value in zip(COLUMNS, rows[-1])}
+                    sample.update(_estimate_fields(incidence))
+                    sample["step_seconds"] = (now - day_started) / max(current_iteration - day_iteration, 1)
+                    publish(sample)
+                    day_started, day_iteration = now, current_iteration
+                if checkpoint_path and checkpoint_every and current_day % checkpoint_every == 0:
+                    save_checkpoint(checkpoint_path, automaton, current_iteration, history=rows)
+                if stop_when_no_infected and automaton.no_infected():
+                    break
+                if config.fast_forward:
+                    skipped_to = automaton.fast_forward(days)
+                    if skipped_to is not None:
+                        # Nothing changes over the skipped days, so they repeat today's counts with no incidence
+                        rows.extend((day, healthy, latent, active, dead, 0, 0)
+                                    for day in range(current_day + 1, skipped_to + 1))
+                        current_day = skipped_to
+                        current_iteration = skipped_to * config.iterations_per_day
+                        day_iteration = current_iteration
+    finally:
+        automaton.close()
+    if infection_log_path:
+        automaton.infection_log.save(infection_log_path)
+
+    if recorder:
+        recorder.close()
+        print(f"Recorded {recorder.frame_count} frames; recording took {recorder.elapsed:.2f}s, "
+              f"{100 * recorder.elapsed / max(step_seconds, 1e-9):.1f}% of {step_seconds:.2f}s stepping",
+              file=sys.stderr)
+
+    results = collect_results(rows, automaton.infection_log)
+    if key:
+        cache.put(key, results)
+    return results
+
+
+def collect_results(rows, infection_log):
+    # The daily series a run returns and the result cache stores: one array per column, plus the estimates
+    table = np.array(rows, dtype=np.int64).reshape(-1, len(COLUMNS))
+    results = {column: table[:, i] for i, column in enumerate(COLUMNS)}
+    results.update(infection_log.estimates(results["day"]))
+    return results
+
+
+def _estimate_fields(values):
+    # JSON has no NaN, so unknown estimates are published as null
+    return {name: None if math.isnan(values[name]) else float(values[name]) for name in ESTIMATES}
+
+
+class TraceFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({field: getattr(record, field, None) for field in TRACE_FIELDS})
+
+
+def enable_infection_trace(path):
+    handler = logging.FileHandler(path, mode="w")
+    handler.setFormatter(TraceFormatter())
+    trace_logger = logging.getLogger("cell_automaton")
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.DEBUG)
+    return handler
+
+
+def write_results(path, results):
+    if str(path).endswith(".npz"):
+        np.savez_compressed(path, **results)
+        return
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(results.keys())
+        writer.writerows(zip(*(column.tolist() for column in results.values())))
+
+
+def build_options(args):
+    options = {}
+    if args.config:
+        options.update(load_scenario(args.config))
+
+    if args.polygon:
+        options["polygon_points"], _ = Polygon.create_preset(args.polygon)
+
+    for name, _ in CONFIG_OPTIONS:
+        value = getattr(args, name)
+        if value is not None:
+            options[name] = value
+
+    options = validate_scenario(options)
+    # A scenario's run length applies unless --days was given
+    days = options.pop("days", None)
+    if args.days is None:
+        args.days = days or DEFAULT_DAYS
+    return options
+
+
+def build_config(args):
+    return Config(**build_options(args))
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--config", "--scenario", dest="config", metavar="PATH",
+                        help="JSON or TOML scenario: Config keyword arguments plus optional polygon and days")
+    parser.add_argument("--polygon", choices=Polygon.PRESETS, help="polygon preset (overrides polygon_points)")
+    parser.add_argument("--days", type=int, help=f"number of simulated days (default: the scenario's or {DEFAULT_DAYS})")
+    parser.add_argument("--stop-when-no-infected", action="store_true",
+                        help="stop early once no cell is infectious")
+    for name, value_type in CONFIG_OPTIONS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=value_type)
+
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache", nargs="?", const="", metavar="DIR",
+                        help="reuse stored results of seeded scenarios (default directory: ~/.cache/disease-spread-simulation)")
+    parser.add_argument("--cache-size", type=float, default=256, metavar="MB",
+                        help="evict least recently used results beyond this size")
+
+
+def open_cache(args):
+    if args.cache is None:
+        return None
+    # Imported here, like the metrics server, so runs that use neither do not load zipfile and asyncio
+    from result_cache import ResultCache
+    return ResultCache(args.cache or None, max_bytes=int(args.cache_size * 2 ** 20))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the disease spread simulation without a GUI.")
+    add_config_arguments(parser)
+    add_cache_arguments(parser)
+    parser.add_argument("--output", default="simulation.csv", help="output file, .csv or .npz")
+    parser.add_argument("--checkpoint", metavar="PATH", help="checkpoint file written every --checkpoint-every days")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="DAYS", help="checkpoint interval in days")
+    parser.add_argument("--resume", metavar="PATH", help="continue from a checkpoint instead of a fresh config")
+    parser.add_argument("--record", metavar="DIR", help="record positions and states of every step for replay")
+    parser.add_argument("--record-every", type=int, default=1, metavar="N", help="record every Nth step only")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write per-phase timing percentiles and hot-path counters as JSON")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve per-day counts as Prometheus text on /metrics and NDJSON on /stream (0: any port)")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="address the metrics endpoint listens on")
+    parser.add_argument("--metrics-linger", type=float, default=0, metavar="SECONDS",
+                        help="keep serving metrics this long after the run ends, for a final scrape")
+    parser.add_argument("--run-label", default="simulate", help="run label attached to published metrics")
+    parser.add_argument("--trace-infections", metavar="PATH",
+                        help="write every infection attempt as a JSON line (slow, for debugging)")
+    parser.add_argument("--infection-log", metavar="PATH",
+                        help="write every successful infection (day, iteration, infector, infectee, prior state, "
+                             "contagiousness, infector age) as columns of an .npz file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        config = None if args.resume else build_config(args)
+        # Profiling and tracing are about the stepping itself, so they never take a stored result
+        cache = open_cache(args) if not (args.profile or args.trace_infections) else None
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.days is None:
+        args.days = DEFAULT_DAYS
+
+    if args.trace_infections:
+        enable_infection_trace(args.trace_infections)
+
+    profiler = Profiler(enabled=True) if args.profile else None
+
+    server = None
+    publish = None
+    try:
+        if args.metrics_port is not None:
+            from metrics import MetricsServer
+            server = MetricsServer(args.metrics_host, args.metrics_port).start()
+            print(f"Serving metrics on {server.url}/metrics", file=sys.stderr)
+            publish = lambda sample: server.publish(args.run_label, sample)
+        results = run_simulation(config, args.days, stop_when_no_infected=args.stop_when_no_infected,
+                                 checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every,
+                                 resume_from=args.resume, record_path=args.record, record_every=args.record_every,
+                                 profiler=profiler, publish=publish, cache=cache,
+                                 infection_log_path=args.infection_log)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        if server:
+            server.stop()
+        return 1
+    write_results(args.output, results)
+
+    if profiler:
+        with open(args.profile, "w") as f:
+            json.dump(profiler.snapshot(), f, indent=2)
+        print(profiler.format_report(), file=sys.stderr)
+    if server:
+        time.sleep(args.metrics_linger)
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+import logging
+import math
+import threading
+import time
+
+from PyQt5.QtCore import QThread
+from cell_automaton import CellAutomaton
+from checkpoint import load_checkpoint, save_checkpoint
+from config import Config
+from infection_log import ESTIMATES
+from profiler import Profiler
+from scenario import scenario_key
+from trajectory import TrajectoryRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class SimulationWorker(QThread):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self._condition = threading.Condition(self.lock)
+        self.cell_automaton = None
+        self.config = None
+        self.current_iteration = 0
+        self.current_day = 0
+        self.is_paused = False
+        self.auto_stop_enabled = True
+        self.auto_stop_triggered = False
+        self.steps_per_frame = 1
+        self.turbo = False
+        self._steps_left = 0
+        self._frame_requested = False
+        self._pending_statistics = []
+        self.history = []
+        # Rows in simulate.py's columns, and where and under which key to store them once the run reaches _cache_days
+        self._result_rows = []
+        self._result_cache = None
+        self._cache_key = None
+        self._cache_days = None
+        self.auto_checkpoint_path = None
+        self.checkpoint_every_days = 10
+        self.record_directory = None
+        self.recorder = None
+        self.profiler = Profiler()
+        self.metrics = None
+        self.metrics_label = "gui"
+        self._day_started = time.perf_counter()
+        self._day_iteration = 0
+        self._running = True
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: not self._running or self._can_step())
+                if not self._running:
+                    return
+                self._step()
+
+    def stop(self):
+        with self._condition:
+            self._close_recorder()
+            self._running = False
+            self._condition.notify_all()
+        self.wait()
+        if self.cell_automaton:
+            self.cell_automaton.close()
+        if self.metrics:
+            self.metrics.stop()
+
+    def _can_step(self):
+        if self.cell_automaton is None or self.is_paused or self._frame_requested:
+            return False
+        return self.turbo or self._steps_left > 0
+
+    def _step(self):
+        self.current_iteration += 1
+        day_finished = self.current_iteration % self.config.iterations_per_day == 0
+        if day_finished:
+            self.current_day += 1
+
+        self.cell_automaton.update(self.current_iteration, self.current_day)
+        self._steps_left -= 1
+
+        if self.recorder:
+            with self.profiler.measure("record"):
+                self.recorder.record(self.current_iteration, self.current_day,
+                                     *self.cell_automaton.get_positions_and_states())
+
+        if day_finished:
+            self._record_statistics()
+            if self.auto_checkpoint_path and self.current_day % self.checkpoint_every_days == 0:
+                self._auto_checkpoint()
+            if self.config.fast_forward and self._fast_forward():
+                # A latent cell reactivates right after the jump, so the epidemic is not over
+                return
+
+        if self.auto_stop_enabled and not self.auto_stop_triggered:
+            if self.cell_automaton.no_infected():
+                self.is_paused = True
+                self.auto_stop_triggered = True
+
+    def _fast_forward(self):
+        skipped_to = self.cell_automaton.fast_forward()
+        if skipped_to is None:
+            return False
+        while self.current_day < skipped_to:
+            self.current_day += 1
+            self._record_statistics()
+        self.current_iteration = skipped_to * self.config.iterations_per_day
+        return True
+
+    def _record_statistics(self):
+        healthy, infected, latent, dead = self.cell_automaton.get_statistics()
+        incidence = self.cell_automaton.reset_daily_statistics()
+        row = (self.current_day, healthy, latent, infected, dead)
+        # Read back by day, since days skipped by a fast-forward were closed before they are recorded here
+        estimates = self.cell_automaton.infection_log.estimates([self.current_day])
+        r_t, generation_interval = (float(estimates[name][0]) for name in ESTIMATES)
+        self._pending_statistics.append(row + (r_t, generation_interval))
+        self.history.append(row)
+        self._result_rows.append(row + (int(incidence["infected"]), int(incidence["dead"])))
+        if self._cache_key and self.current_day == self._cache_days:
+            self._store_result()
+        if self.metrics:
+            now = time.perf_counter()
+            iterations = max(self.current_iteration - self._day_iteration, 1)
+            self.metrics.publish(self.metrics_label, {
+                "day": self.current_day, "healthy": healthy, "latent": latent, "active": infected, "dead": dead,
+                "new_infected": int(incidence["infected"]), "new_dead": int(incidence["dead"]),
+                "step_seconds": (now - self._day_started) / iterations,
+                # JSON has no NaN
+                "r_t": None if math.isnan(r_t) else r_t,
+                "generation_interval": None if math.isnan(generation_interval) else generation_interval,
+            })
+            self._day_started, self._day_iteration = now, self.current_iteration
+
+    def _store_result(self):
+        # Stored under the key simulate.py would look up for the same scenario and length, unless a setting was
+        # changed mid-run (e.g. fast-forward), which makes the run match no scenario
+        key, self._cache_key = self._cache_key, None
+        if scenario_key(self.config, self._cache_days) != key:
+            return
+        from simulate import collect_results
+        try:
+            self._result_cache.put(key, collect_results(self._result_rows, self.cell_automaton.infection_log))
+        except OSError as e:
+            logger.warning("Storing the result of %d days failed: %s", self._cache_days, e)
+
+    def _auto_checkpoint(self):
+        try:
+            save_checkpoint(self.auto_checkpoint_path, self.cell_automaton, self.current_iteration, self.history)
+        except OSError as e:
+            logger.warning("Auto-checkpoint to %s failed: %s", self.auto_checkpoint_path, e)
+
+    def start_simulation(self, config: Config, result_cache=None, days=None):
+        # Built outside the lock so seeding a large population does not freeze the current frame; the config must not
+        # be the running one, which is only swapped out below. Given a cache and a run length, a seeded run stores
+        # its daily series once it reaches that day
+        cell_automaton = CellAutomaton(config, profiler=self.profiler)
+        key = scenario_key(config, days) if result_cache is not None and days else None
+        with self._condition:
+            self._replace_automaton(cell_automaton)
+            self.config = config
+            self.current_iteration = 0
+            self.current_day = 0
+            self.is_paused = False
+            self.auto_stop_triggered = False
+            self._steps_left = 0
+            self._pending_statistics = []
+            self.history = []
+            self._result_rows = []
+            self._result_cache, self._cache_key, self._cache_days = result_cache, key, days
+            self._record_statistics()
+            self._close_recorder()
+            if self.record_directory:
+                self.recorder = TrajectoryRecorder(self.record_directory, config.cell_count, config)
+            self._condition.notify_all()
+        return cell_automaton
+
+    def stop_simulation(self):
+        # Drops the running simulation and any rows not yet taken, e.g. before showing a cached result
+        with self._condition:
+            self._close_recorder()
+            self._replace_automaton(None)
+            self.config = None
+            self._pending_statistics = []
+            self.history = []
+            self._result_rows = []
+            self._cache_key = None
+
+    def _replace_automaton(self, cell_automaton):
+        if self.cell_automaton:
+            self.cell_automaton.close()
+        self.cell_automaton = cell_automaton
+
+    def set_record_directory(self, directory):
+        with self._condition:
+            self.record_directory = directory
+            if directory is None:
+                self._close_recorder()
+
+    def _close_recorder(self):
+        if self.recorder:
+            self.recorder.close()
+            logger.info("Recorded %d frames to %s; recording took %.2fs",
+                        self.recorder.frame_count, self.recorder.directory, self.recorder.elapsed)
+            self.recorder = None
+
+    def save_checkpoint(self, path):
+        with self._condition:
+            if self.cell_automaton is None:
+                raise ValueError("No simulation to checkpoint.")
+            save_checkpoint(path, self.cell_automaton, self.current_iteration, self.history)
+
+    def load_checkpoint(self, path):
+        cell_automaton, current_iteration, history = load_checkpoint(path)
+        cell_automaton.profiler = self.profiler
+        # Checkpoints written by simulate.py carry extra incidence columns after the first five
+        history = [tuple(row[:5]) for row in history.tolist()] if history is not None else []
+        with self._condition:
+            self._replace_automaton(cell_automaton)
+            self.config = cell_automaton.config
+            self.current_iteration = current_iteration
+            self.current_day = cell_automaton.current_day
+            self.is_paused = True
+            self.auto_stop_triggered = False
+            self._steps_left = 0
+            self._pending_statistics = []
+            self.history = history
+            # Incidence before the checkpoint is not kept, so a resumed run is never stored
+            self._result_rows = []
+            self._cache_key = None
+            self._condition.notify_all()
+        return cell_automaton
+
+    def begin_frame(self):
+        # Ask the stepping loop to yield the lock to the GUI thread at its next step boundary
+        self._frame_requested = True
+        self.lock.acquire()
+
+    def end_frame(self):
+        self._frame_requested = False
+        self._steps_left = self.steps_per_frame
+        self._condition.notify_all()
+        self.lock.release()
+
+    def snapshot(self):
+        # Outside the frame loop (a resize, leaving a replay): copy the drawn state at the next step boundary
+        self._frame_requested = True
+        with self._condition:
+            self._frame_requested = False
+            self._condition.notify_all()
+            return self.cell_automaton.snapshot() if self.cell_automaton else None
+
+    def take_statistics(self):
+        statistics, self._pending_statistics = self._pending_statistics, []
+        return statistics
+
+    def set_paused(self, paused):
+        with self._condition:
+            self.is_paused = paused
+            self._condition.notify_all()
+
+    def set_steps_per_frame(self, steps_per_frame):
+        with self._condition:
+            self.steps_per_frame = max(1, int(steps_per_frame))
+
+    def set_profiling(self, enabled):
+        with self._condition:
+            if enabled and not self.profiler.enabled:
+                self.profiler.reset()
+            self.profiler.enabled = enabled
+
+    def set_metrics(self, server):
+        with self._condition:
+            previous, self.metrics = self.metrics, server
+            self._day_started, self._day_iteration = time.perf_counter(), self.current_iteration
+        if previous:
+            previous.stop()
+
+    def set_turbo(self, turbo):
+        with self._condition:
+            self.turbo = turbo
+            self._condition.notify_all()
@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+
+
+class SpatialGrid:
+    # Points are sorted by bucket key on rebuild, so a query only touches the buckets overlapping its radius
+
+    def __init__(self, cell_size):
+        if cell_size <= 0:
+            raise ValueError("Grid cell size must be positive.")
+        self.cell_size = float(cell_size)
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.ids = np.empty(0, dtype=np.intp)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._origin_x = 0.0
+        self._origin_y = 0.0
+        self._columns = 1
+        self._rows = 1
+        self.candidates_tested = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rebuild(self, x, y, ids=None):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if ids is None:
+            ids = np.arange(len(x))
+
+        if len(x):
+            self._origin_x = x.min()
+            self._origin_y = y.min()
+            columns = self._bucket(x.max() - self._origin_x) + 1
+            rows = self._bucket(y.max() - self._origin_y) + 1
+        else:
+            columns = rows = 1
+        self._columns = int(columns)
+        self._rows = int(rows)
+
+        keys = self._key(self._bucket(x - self._origin_x), self._bucket(y - self._origin_y))
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self.x = x[order]
+        self.y = y[order]
+        self.ids = np.asarray(ids, dtype=np.intp)[order]
+
+    def query_radius(self, px, py, radius):
+        _, ids = self.pairs_within([px], [py], radius, query_ids=[-1])
+        return ids
+
+    def pairs_within(self, px, py, radius, query_ids=None):
+        """Return (query_id, point_id) pairs with the point no further than radius from the query.
+
+        A pair whose ids are equal is dropped, so querying the indexed points
+        against themselves yields no self-pairs.
+        """
+        px = np.asarray(px, dtype=np.float64)
+        py = np.asarray(py, dtype=np.float64)
+        if query_ids is None:
+            query_ids = np.arange(len(px))
+        query_ids = np.asarray(query_ids, dtype=np.intp)
+        empty = np.empty(0, dtype=np.intp)
+        if len(px) == 0 or len(self.ids) == 0:
+            return empty, empty
+
+        reach = max(1, math.ceil(radius / self.cell_size))
+        offsets = np.arange(-reach, reach + 1)
+        bucket_x = self._bucket(px - self._origin_x)[:, None] + np.repeat(offsets, len(offsets))[None, :]
+        bucket_y = self._bucket(py - self._origin_y)[:, None] + np.tile(offsets, len(offsets))[None, :]
+        valid = (bucket_x >= 0) & (bucket_x < self._columns) & (bucket_y >= 0) & (bucket_y < self._rows)
+
+        query, _ = np.nonzero(valid)
+        keys = self._key(bucket_x[valid], bucket_y[valid])
+        starts = np.searchsorted(self._keys, keys, side="left")
+        counts = np.searchsorted(self._keys, keys, side="right") - starts
+
+        total = counts.sum()
+        if total == 0:
+            return empty, empty
+        query = np.repeat(query, counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        points = np.repeat(starts, counts) + (np.arange(total) - first)
+        self.candidates_tested += int(total)
+
+        distances_sq = (self.x[points] - px[query]) ** 2 + (self.y[points] - py[query]) ** 2
+        hits = distances_sq <= radius ** 2
+        sources = query_ids[query[hits]]
+        targets = self.ids[points[hits]]
+        distinct = sources != targets
+        return sources[distinct], targets[distinct]
+
+    def _bucket(self, offset):
+        return np.floor_divide(offset, self.cell_size).astype(np.int64)
+
+    def _key(self, bucket_x, bucket_y):
+        return bucket_y * self._columns + bucket_x
@@ -1,12 +1,22 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QScrollArea, QLabel
-import matplotlib.pyplot as plt
+from PyQt5.QtCore import QTimer
+import numpy as np
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.collections import PolyCollection
+from profiler import Profiler
 
 class StatisticsWidget(QWidget):
+    REDRAW_INTERVAL_MS = 100
+    MAX_PLOT_POINTS = 500
+
     def __init__(self, parent=None, config=None):
         super().__init__(parent)
         self.config = config
-        self.figure, self.ax = plt.subplots()
+        self.profiler = Profiler()
+        # A bare Figure skips pyplot's global figure manager, which an embedded canvas never uses
+        self.figure = Figure()
+        self.ax = self.figure.add_subplot()
         self.canvas = FigureCanvas(self.figure)
         self.canvas.setFixedSize(600, 350)
         self.canvas.setStyleSheet("background-color:white;")
@@ -14,22 +24,32 @@ class StatisticsWidget(QWidget):
         self.figure.patch.set_facecolor('none')
         self.set_plot_background()
 
-        self.time_data = []
-        self.healthy_data = []
-        self.latent_data = []
-        self.infected_data = []
-        self.dead_data = []
+        # Samples are kept in preallocated columns (day, healthy, latent, infected, dead) that grow by doubling
+        self._samples = np.zeros((1024, 5), dtype=np.int64)
+        # R_t and generation interval of the same days, NaN while unknown
+        self._estimates = np.full((1024, 2), np.nan)
+        self._size = 0
+        self._dirty = False
+        self._create_artists()
+
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.timeout.connect(self.redraw_if_needed)
+        self.redraw_timer.start(self.REDRAW_INTERVAL_MS)
 
         self.healthy_label = QLabel("Healthy: 0")
         self.latent_label = QLabel("Latent: 0")
         self.infected_label = QLabel("Infected: 0")
         self.dead_label = QLabel("Dead: 0")
+        self.r_t_label = QLabel("R_t: -")
+        self.generation_label = QLabel("Generation interval: -")
 
         label_layout = QHBoxLayout()
         label_layout.addWidget(self.healthy_label)
         label_layout.addWidget(self.latent_label)
         label_layout.addWidget(self.infected_label)
         label_layout.addWidget(self.dead_label)
+        label_layout.addWidget(self.r_t_label)
+        label_layout.addWidget(self.generation_label)
 
         layout = QVBoxLayout()
         layout.addLayout(label_layout)
@@ -44,57 +64,139 @@ class StatisticsWidget(QWidget):
         self.ax.xaxis.label.set_color('black')
         self.ax.yaxis.label.set_color('black')
 
-    def update_plot(self):
-        self.ax.clear()
-        self.set_plot_background()
+    def _create_artists(self):
+        series = [
+            ('Latent', self.config.color_latent),
+            ('Infectious', self.config.color_active),
+            ('Dead', self.config.color_dead),
+            ('Susceptible', self.config.color_healthy),
+        ]
+        self.areas = []
+        for label, color in series:
+            area = PolyCollection([], facecolors=[[c / 255 for c in color]], label=label)
+            self.ax.add_collection(area)
+            self.areas.append(area)
 
-        total_population = max((h + l + i + d for h, l, i, d in
-                                zip(self.healthy_data, self.latent_data, self.infected_data, self.dead_data)),
-                               default=0)
-        if total_population == 0:
-            total_population = len(self.healthy_data)
+        legend = self.ax.legend(loc='upper left', facecolor=(37 / 255, 61 / 255, 71 / 255), edgecolor=(1, 1, 1))
+        for text in legend.get_texts():
+            text.set_color((1, 1, 1))
 
-        latent_infected = [l + i for l, i in zip(self.latent_data, self.infected_data)]
-        dead_latent_infected = [l + i + d for l, i, d in zip(self.latent_data, self.infected_data, self.dead_data)]
+        # R_t on its own scale over the bands, with the epidemic threshold at 1
+        self.r_t_ax = self.ax.twinx()
+        self.r_t_ax.set_ylabel('R_t', color='black')
+        self.r_t_ax.tick_params(axis='y', colors='black')
+        self.r_t_ax.axhline(1, color='black', linewidth=0.8, linestyle=':')
+        self.r_t_line, = self.r_t_ax.plot([], [], color='black', linewidth=1.2, linestyle='--')
+
+    @property
+    def time_data(self):
+        return self._samples[:self._size, 0]
+
+    @property
+    def healthy_data(self):
+        return self._samples[:self._size, 1]
+
+    @property
+    def latent_data(self):
+        return self._samples[:self._size, 2]
+
+    @property
+    def infected_data(self):
+        return self._samples[:self._size, 3]
+
+    @property
+    def dead_data(self):
+        return self._samples[:self._size, 4]
+
+    @property
+    def r_t_data(self):
+        return self._estimates[:self._size, 0]
+
+    @property
+    def generation_interval_data(self):
+        return self._estimates[:self._size, 1]
+
+    def _plot_samples(self):
+        samples = self._samples[:self._size]
+        estimates = self._estimates[:self._size]
+        if self._size > self.MAX_PLOT_POINTS:
+            rows = np.linspace(0, self._size - 1, self.MAX_PLOT_POINTS).astype(np.intp)
+            samples, estimates = samples[rows], estimates[rows]
+        return samples, estimates
 
-        self.ax.fill_between(self.time_data, 0, self.latent_data, color=[c/255 for c in self.config.color_latent],
-                             label='Latent')
-        self.ax.fill_between(self.time_data, self.latent_data, latent_infected, color=[c/255 for c in self.config.color_active],
-                             label='Infectious')
-        self.ax.fill_between(self.time_data, latent_infected, dead_latent_infected, color=[c/255 for c in self.config.color_dead], label='Dead')
+    def update_plot(self):
+        with self.profiler.measure("plot"):
+            self._update_plot()
 
-        if total_population - max(dead_latent_infected, default=0) > 0:
-            self.ax.fill_between(self.time_data, dead_latent_infected, [total_population] * len(dead_latent_infected),
-                                 color=[c/255 for c in self.config.color_healthy], label='Susceptible')
+    def _update_plot(self):
+        samples, estimates = self._plot_samples()
+        time = samples[:, 0]
+        healthy, latent, infected, dead = samples[:, 1], samples[:, 2], samples[:, 3], samples[:, 4]
 
-        legend = self.ax.legend(loc='upper left', facecolor=(37 / 255, 61 / 255, 71 / 255), edgecolor=(1, 1, 1))
-        for text in legend.get_texts():
-            text.set_color((1, 1, 1))
-        self.canvas.draw()
+        total_population = int((healthy + latent + infected + dead).max(initial=0))
+        if total_population == 0:
+            total_population = len(healthy)
+
+        latent_infected = latent + infected
+        dead_latent_infected = latent_infected + dead
+        bands = [
+            (np.zeros_like(latent), latent),
+            (latent, latent_infected),
+            (latent_infected, dead_latent_infected),
+            (dead_latent_infected, np.full_like(dead_latent_infected, total_population)),
+        ]
+        show_susceptible = total_population - dead_latent_infected.max(initial=0) > 0
+
+        for i, (area, (lower, upper)) in enumerate(zip(self.areas, bands)):
+            if len(time) == 0 or (i == 3 and not show_susceptible):
+                area.set_verts([])
+                continue
+            outline = np.concatenate([np.column_stack([time, upper]), np.column_stack([time[::-1], lower[::-1]])])
+            area.set_verts([outline])
+
+        r_t = estimates[:, 0]
+        self.r_t_line.set_data(time, r_t)
+        self.r_t_ax.set_ylim(0, max(2, np.nanmax(r_t, initial=0) * 1.1))
+
+        if len(time):
+            self.ax.set_xlim(time[0], max(time[-1], time[0] + 1))
+            self.ax.set_ylim(0, max(total_population, 1) * 1.05)
+        self.canvas.draw_idle()
+        self._dirty = False
 
         self.update_labels()
 
+    def redraw_if_needed(self):
+        if self._dirty and self.isVisible():
+            self.update_plot()
+
     def update_labels(self):
-        self.healthy_label.setText(f"Healthy: {self.healthy_data[-1] if self.healthy_data else 0}")
-        self.latent_label.setText(f"Latent: {self.latent_data[-1] if self.latent_data else 0}")
-        self.infected_label.setText(f"Infected: {self.infected_data[-1] if self.infected_data else 0}")
-        self.dead_label.setText(f"Dead: {self.dead_data[-1] if self.dead_data else 0}")
+        latest = self._samples[self._size - 1] if self._size else np.zeros(5, dtype=np.int64)
+        self.healthy_label.setText(f"Healthy: {latest[1]}")
+        self.latent_label.setText(f"Latent: {latest[2]}")
+        self.infected_label.setText(f"Infected: {latest[3]}")
+        self.dead_label.setText(f"Dead: {latest[4]}")
+        r_t, generation_interval = self._estimates[self._size - 1] if self._size else (np.nan, np.nan)
+        self.r_t_label.setText("R_t: -" if np.isnan(r_t) else f"R_t: {r_t:.2f}")
+        self.generation_label.setText("Generation interval: -" if np.isnan(generation_interval)
+                                      else f"Generation interval: {generation_interval:.1f} d")
 
     def save_plot(self):
+        self.update_plot()
         self.figure.savefig('simulation_plot.png', bbox_inches='tight', dpi=300)
 
-    def add_data(self, day, healthy, latent, infected, dead):
-        self.time_data.append(day)
-        self.healthy_data.append(healthy)
-        self.latent_data.append(latent)
-        self.infected_data.append(infected)
-        self.dead_data.append(dead)
-        self.update_plot()
+    def add_data(self, day, healthy, latent, infected, dead, r_t=np.nan, generation_interval=np.nan):
+        # Several samples for the same day collapse into one point
+        if self._size and self._samples[self._size - 1, 0] == day:
+            self._size -= 1
+        elif self._size == len(self._samples):
+            self._samples = np.concatenate([self._samples, np.zeros_like(self._samples)])
+            self._estimates = np.concatenate([self._estimates, np.full_like(self._estimates, np.nan)])
+        self._samples[self._size] = (day, healthy, latent, infected, dead)
+        self._estimates[self._size] = (r_t, generation_interval)
+        self._size += 1
+        self._dirty = True
 
     def reset_data(self):
-        self.time_data.clear()
-        self.healthy_data.clear()
-        self.latent_data.clear()
-        self.infected_data.clear()
-        self.dead_data.clear()
-        self.update_plot()
\ No newline at end of file
+        self._size = 0
+        self.update_plot()
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from cell_automaton import CellAutomaton
+from checkpoint import load_checkpoint, save_checkpoint
+from config import Config
+from infection_log import InfectionLog
+
+
+def run(config, days, automaton=None, first_iteration=1):
+    automaton = automaton or CellAutomaton(config)
+    for iteration in range(first_iteration, days * config.iterations_per_day + 1):
+        current_day = iteration // config.iterations_per_day
+        automaton.update(iteration, current_day)
+        if iteration % config.iterations_per_day == 0:
+            automaton.reset_daily_statistics()
+    return automaton
+
+
+def test_r_t_is_finite_and_bounded_on_days_with_transmissions():
+    config = Config(cell_count=400, infected_count=5, seed=3)
+    log = run(config, 200).infection_log
+    transmissions = np.asarray(log.transmissions)
+    r_t = np.asarray(log.r_t)
+    assert transmissions.sum() > 0
+    busy = transmissions > 0
+    assert np.isfinite(r_t[busy]).all()
+    # Nobody can infect more cells than there were susceptible ones
+    assert (r_t[busy] > 0).all() and (r_t[busy] <= config.cell_count - config.infected_count).all()
+
+
+def test_replayed_log_reproduces_the_estimates():
+    log = run(Config(cell_count=400, infected_count=5, seed=3), 120).infection_log
+    replayed = InfectionLog.from_arrays(log.to_arrays())
+    np.testing.assert_array_equal(replayed.r_t, log.r_t)
+    np.testing.assert_array_equal(replayed.generation_interval, log.generation_interval)
+
+
+def test_resumed_run_matches_the_uninterrupted_estimates(tmp_path):
+    # Weights of a 100-day period change in the last digit if normalised twice
+    config = Config(cell_count=400, infected_count=10, infection_period=100, seed=2)
+    uninterrupted = run(config, 90).infection_log
+    path = tmp_path / "checkpoint.npz"
+    save_checkpoint(path, run(config, 70), 70 * config.iterations_per_day)
+    automaton, iteration, _ = load_checkpoint(path)
+    resumed = run(automaton.config, 90, automaton, iteration + 1).infection_log
+    np.testing.assert_array_equal(resumed.weights, uninterrupted.weights)
+    np.testing.assert_array_equal(resumed.r_t, uninterrupted.r_t)
+
+
+def test_short_infection_period_falls_back_to_uniform_weights():
+    # The default curve is zero for the first 60 days, so a 10-day period gives all-zero weights
+    config = Config(cell_count=200, infected_count=5, infection_period=10, seed=1)
+    log = run(config, 20).infection_log
+    np.testing.assert_allclose(log.weights, np.full(10, 0.1))
+    assert len(log.r_t) == 21
+
+
+def test_weights_need_at_least_one_day():
+    with pytest.raises(ValueError):
+        InfectionLog(np.empty(0))
@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+FIELDS = {"x": np.float32, "y": np.float32, "state": np.uint8}
+# Memory the in-memory ring may take, and the most frames it holds however small the population
+CHUNK_BYTES = 64 << 20
+MAX_CHUNK_FRAMES = 256
+
+
+class TrajectoryRecorder:
+    # Frames accumulate in a fixed-size in-memory ring of chunk_frames steps; every full ring is written out as one
+    # chunk file per field, so disk I/O is a few bulk writes per chunk rather than per step. Unless given, the ring's
+    # length is whatever fits in chunk_bytes, so a large population records shorter chunks instead of more memory
+
+    def __init__(self, directory, cell_count, config=None, chunk_frames=None, record_every=1, chunk_bytes=CHUNK_BYTES):
+        self.directory = directory
+        self.cell_count = cell_count
+        if chunk_frames is None:
+            bytes_per_frame = cell_count * sum(np.dtype(dtype).itemsize for dtype in FIELDS.values()) + 16
+            chunk_frames = min(MAX_CHUNK_FRAMES, max(1, chunk_bytes // bytes_per_frame))
+        self.chunk_frames = chunk_frames
+        self.record_every = max(1, int(record_every))
+        self.config = config.to_dict() if config is not None else {}
+        self.buffers = {name: np.empty((chunk_frames, cell_count), dtype=dtype) for name, dtype in FIELDS.items()}
+        self.clock = np.empty((chunk_frames, 2), dtype=np.int64)
+        self.frame_count = 0
+        self.frames_written = 0
+        self.chunk_count = 0
+        self.elapsed = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, current_iteration, current_day, x, y, state):
+        if current_iteration % self.record_every:
+            return
+        start = time.perf_counter()
+        slot = self.frame_count % self.chunk_frames
+        self.buffers["x"][slot] = x
+        self.buffers["y"][slot] = y
+        self.buffers["state"][slot] = state
+        self.clock[slot] = (current_iteration, current_day)
+        self.frame_count += 1
+        if slot == self.chunk_frames - 1:
+            self._flush(self.chunk_frames)
+        self.elapsed += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        pending = self.frame_count - self.frames_written
+        if pending:
+            self._flush(pending)
+        self._write_index()
+        self.elapsed += time.perf_counter() - start
+
+    def _flush(self, frames):
+        for name, buffer in self.buffers.items():
+            np.save(self._chunk_path(self.directory, name, self.chunk_count), buffer[:frames])
+        np.save(self._chunk_path(self.directory, "clock", self.chunk_count), self.clock[:frames])
+        self.chunk_count += 1
+        self.frames_written += frames
+        self._write_index()
+
+    def _write_index(self):
+        index = {
+            "cell_count": self.cell_count,
+            "chunk_frames": self.chunk_frames,
+            "frame_count": self.frames_written,
+            "record_every": self.record_every,
+            "config": self.config,
+        }
+        with open(os.path.join(self.directory, INDEX_FILE), "w") as f:
+            json.dump(index, f)
+
+    @staticmethod
+    def _chunk_path(directory, name, chunk):
+        return os.path.join(directory, f"{name}_{chunk:05d}.npy")
+
+
+class TrajectoryReader:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.cell_count = index["cell_count"]
+        self.chunk_frames = index["chunk_frames"]
+        self.frame_count = index["frame_count"]
+        self.config = index["config"]
+        self._chunks = {}
+
+    def __len__(self):
+        return self.frame_count
+
+    def _chunk(self, chunk):
+        if chunk not in self._chunks:
+            self._chunks[chunk] = {
+                name: np.load(TrajectoryRecorder._chunk_path(self.directory, name, chunk), mmap_mode="r")
+                for name in (*FIELDS, "clock")
+            }
+        return self._chunks[chunk]
+
+    def frame(self, index):
+        if not 0 <= index < self.frame_count:
+            raise IndexError(f"Frame {index} out of range (0-{self.frame_count - 1})")
+        chunk = self._chunk(index // self.chunk_frames)
+        slot = index % self.chunk_frames
+        current_iteration, current_day = chunk["clock"][slot]
+        return int(current_iteration), int(current_day), chunk["x"][slot], chunk["y"][slot], chunk["state"][slot]
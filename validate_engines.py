@@ -0,0 +1,108 @@
+import argparse
+import itertools
+import math
+import sys
+
+import numpy as np
+
+from ensemble import expand_runs, run_ensemble
+from simulate import add_config_arguments, build_options
+
+# An epidemic that peaks within a few weeks, so short runs of the slow reference engine still say something
+VALIDATION_OPTIONS = {
+    "cell_count": 400,
+    "infected_count": 10,
+    "infection_period": 14,
+    "contagiousness": (5, 5, 10, 0.5),
+}
+
+METRICS = ("final_healthy", "final_dead", "peak_active", "peak_day", "total_infected")
+
+
+def run_metrics(table):
+    metrics = {}
+    for run in np.unique(table["run"]):
+        rows = table["run"] == run
+        engine = str(table["engine"][rows][0])
+        active = table["active"][rows]
+        values = {
+            "final_healthy": table["healthy"][rows][-1],
+            "final_dead": table["dead"][rows][-1],
+            "peak_active": active.max(),
+            "peak_day": table["day"][rows][active.argmax()],
+            "total_infected": table["new_infected"][rows].sum(),
+        }
+        for name, value in values.items():
+            metrics.setdefault(engine, {}).setdefault(name, []).append(float(value))
+    return {engine: {name: np.array(values) for name, values in engine_metrics.items()}
+            for engine, engine_metrics in metrics.items()}
+
+
+def ks_test(a, b):
+    # Two-sample Kolmogorov-Smirnov statistic with the asymptotic p-value
+    a, b = np.sort(a), np.sort(b)
+    values = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, values, side="right") / len(a)
+    cdf_b = np.searchsorted(b, values, side="right") / len(b)
+    statistic = float(np.abs(cdf_a - cdf_b).max())
+    effective = math.sqrt(len(a) * len(b) / (len(a) + len(b)))
+    x = (effective + 0.12 + 0.11 / effective) * statistic
+    if x == 0:
+        return statistic, 1.0
+    p_value = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * x * x) for k in range(1, 101))
+    return statistic, min(max(p_value, 0.0), 1.0)
+
+
+def compare_engines(metrics, alpha):
+    comparisons = []
+    for first, second in itertools.combinations(sorted(metrics), 2):
+        for name in METRICS:
+            statistic, p_value = ks_test(metrics[first][name], metrics[second][name])
+            comparisons.append({
+                "engines": (first, second), "metric": name, "statistic": statistic, "p_value": p_value,
+                "means": (float(metrics[first][name].mean()), float(metrics[second][name].mean())),
+                "passed": p_value >= alpha,
+            })
+    return comparisons
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the compute engines produce the same epidemic statistics.")
+    add_config_arguments(parser)
+    parser.set_defaults(days=40)
+    parser.add_argument("--engines", default="reference,population,numba", help="comma-separated engines")
+    parser.add_argument("--replicates", type=int, default=40, help="seeded runs per engine")
+    parser.add_argument("--alpha", type=float, default=0.01, help="KS p-value below which a metric fails")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    options = dict(VALIDATION_OPTIONS)
+    options.update(build_options(args))
+    engines = args.engines.split(",")
+    # Every engine runs the same list of seeds, so engines sharing a random stream must agree exactly
+    runs = expand_runs(options, {"engine": engines}, args.replicates, args.seed or 0)
+    seeds = [run["seed"] for run in runs[:args.replicates]]
+    for run in runs:
+        run["seed"] = seeds[run["replicate"]]
+
+    table, failures = run_ensemble(runs, args.days, args.workers)
+    for run, error in failures:
+        print(f"run {run['run']} ({run['parameters']['engine']}) failed: {error}", file=sys.stderr)
+    if failures:
+        return 1
+
+    comparisons = compare_engines(run_metrics(table), args.alpha)
+    for comparison in comparisons:
+        first, second = comparison["engines"]
+        mean_first, mean_second = comparison["means"]
+        print(f"{'ok  ' if comparison['passed'] else 'FAIL'} {first} vs {second} {comparison['metric']}: "
+              f"mean {mean_first:.1f} vs {mean_second:.1f}, D={comparison['statistic']:.3f}, "
+              f"p={comparison['p_value']:.3f}")
+    return 0 if all(comparison["passed"] for comparison in comparisons) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())